@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""Measures in-place writes of SlowlyChangingDimension on long histories.
+
+Usage:
+    python benchmarks/bench_history.py [--versions N] [--members N]
+
+Builds an indexed dimension holding one member with many versions and
+other members, and times:
+- a type 1 change of the long member, with its versions stored
+  consecutively and interleaved with other members;
+- a load of new and changed members interleaved, which appends rows
+  between in-place writes.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import tables as tb
+
+from pyscd.dimension import SlowlyChangingDimension
+
+
+class Dimension(tb.IsDescription):
+    order           = tb.StringCol(16, pos=0)
+    status          = tb.StringCol(16, pos=1)
+    currency        = tb.StringCol(16, pos=2)
+    scd_id          = tb.Int64Col(pos=3)
+    scd_valid_from  = tb.Int64Col(pos=4)
+    scd_valid_to    = tb.Int64Col(pos=5)
+    scd_version     = tb.Int16Col(pos=6)
+    scd_current     = tb.BoolCol(pos=7)
+    scd_hash        = tb.StringCol(40, pos=8)
+
+
+def open_dimension(table, asof):
+    return SlowlyChangingDimension(table, ['order'], ['currency'],
+                                   ['status'], asof=asof, verbose=False)
+
+
+def build(h5file, name, versions, members, interleaved):
+    """Create a table with versions rows of member b'long' and members other
+       members, either after the long member or between its versions.
+    """
+    table = h5file.create_table('/', name, Dimension)
+    n = versions + members
+    rows = np.zeros(n, dtype=table.dtype)
+
+    long = np.arange(versions)
+    if interleaved:
+        long = long * (n // versions)
+    other = np.setdiff1d(np.arange(n), long)
+
+    rows['order'][long] = b'long'
+    rows['status'][long] = [str(i).encode() for i in range(versions)]
+    rows['scd_version'][long] = np.arange(1, versions + 1)
+    rows['scd_current'][long[-1]] = True
+    rows['order'][other] = [str(i).encode() for i in range(members)]
+    rows['scd_version'][other] = 1
+    rows['scd_current'][other] = True
+    rows['scd_id'] = np.arange(1, n + 1)
+    rows['currency'] = b'USD'
+
+    dim = open_dimension(table, '2015-10-23')
+    for row in rows:
+        row['scd_hash'] = dim._compute_hash_row(row)
+
+    table.append(rows)
+    table.flush()
+    table.cols.order.create_index()
+    return table
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--versions', type=int, default=3000)
+    parser.add_argument('--members', type=int, default=3000)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), 'bench_history.h5')
+    h5file = tb.open_file(path, mode='w')
+    try:
+        for interleaved in (False, True):
+            name = 'interleaved' if interleaved else 'consecutive'
+            table = build(h5file, name, args.versions, args.members,
+                          interleaved)
+            dim = open_dimension(table, '2015-10-24')
+
+            current = table.read_where('(order == b"long") & scd_current')[0]
+            row = {'order': b'long', 'status': current['status'],
+                   'currency': b'EUR'}
+
+            t0 = time.perf_counter()
+            dim.update(row)
+            dim.flush()
+            print('type 1, {:<12} {:8.3f} s'.format(
+                name, time.perf_counter() - t0))
+
+        dim = open_dimension(table, '2015-10-25')
+        t0 = time.perf_counter()
+        for i in range(args.members):
+            dim.update({'order': 'new{}'.format(i).encode(),
+                        'status': b'0', 'currency': b'USD'})
+            dim.update({'order': str(i).encode(),
+                        'status': b'0', 'currency': b'CHF'})
+        dim.flush()
+        print('mixed load, {} rows    {:8.3f} s'.format(
+            2 * args.members, time.perf_counter() - t0))
+    finally:
+        h5file.close()
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""Measures the import time of pyscd modules, each in a fresh interpreter.
+
+Usage:
+    python benchmarks/bench_startup.py [module ...] [--runs N]
+
+Prints the median cumulative import time of each module and the slowest
+modules it pulls in, as reported by python -X importtime. Modules already
+imported by an empty interpreter, like those of site, are left out.
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+
+MODULES = ['pyscd', 'pyscd.hashing', 'pyscd.keys', 'pyscd.dimension']
+
+
+def importtime(code):
+    """Return the cumulative import time in microseconds of each module
+       imported by running the code in a new interpreter.
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                            stderr=subprocess.PIPE,
+                            universal_newlines=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        try:
+            _, cumulative, name = line.split('|')
+            times[name.strip()] = int(cumulative)
+        except ValueError:
+            continue
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('modules', nargs='*', default=MODULES)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    startup = set(importtime('pass'))
+
+    for module in args.modules:
+        runs = [importtime('import {}'.format(module))
+                for i in range(args.runs)]
+        total = statistics.median(times[module] for times in runs)
+        print('{:<20} {:8.1f} ms'.format(module, total / 1000))
+
+        slowest = sorted((cumulative, name)
+                         for name, cumulative in runs[-1].items()
+                         if name not in startup and name != module)
+        for cumulative, name in reversed(slowest[-5:]):
+            print('    {:<30} {:8.1f} ms'.format(name, cumulative / 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,12 @@
 __version__ = '1.2.0'
 
-from pyscd.dimension import SlowlyChangingDimension
+
+def __getattr__(name):
+    # Load the dimension, with numpy and PyTables, on first use only, so
+    # importing the package or its light modules, like pyscd.hashing,
+    # stays fast.
+    if name == 'SlowlyChangingDimension':
+        from pyscd.dimension import SlowlyChangingDimension
+        return SlowlyChangingDimension
+    raise AttributeError('module {!r} has no attribute {!r}'.
+                         format(__name__, name))
@@ -0,0 +1,6 @@
+# -*- coding: utf-8 -*-
+
+import sys
+from pyscd.cli import main
+
+sys.exit(main())
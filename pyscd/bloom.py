@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+
+import math
+import numpy as np
+
+
+class BloomFilter(object):
+    """A compact set of key hashes that answers membership with no false
+       negatives: when a hash is not in the filter, it was never added.
+       A hash in the filter was added with a probability of 1 - error_rate,
+       as long as no more than 'capacity' hashes were added.
+
+       Hashes are the hex or binary digests of pyscd.hashing.compute_hash,
+       which are already uniformly distributed, so the bit positions are
+       taken from the digest itself with double hashing.
+    """
+    def __init__(self, capacity, error_rate=0.01):
+        if capacity < 1:
+            raise ValueError('Capacity must be a positive integer')
+        if not 0 < error_rate < 1:
+            raise ValueError('Error rate must be between 0 and 1')
+
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.nbits = int(math.ceil(-capacity * math.log(error_rate) /
+                                   math.log(2) ** 2))
+        self.nhashes = max(1, int(round(self.nbits / capacity *
+                                        math.log(2))))
+        self.bits = np.zeros((self.nbits + 7) // 8, dtype=np.uint8)
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, hashvalue):
+        bits = self.bits
+        for position in self.__positions(hashvalue):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    def add(self, hashvalue):
+        bits = self.bits
+        for position in self.__positions(hashvalue):
+            bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __positions(self, hashvalue):
+        if isinstance(hashvalue, str):
+            hashvalue = bytes.fromhex(hashvalue)
+        hashvalue = hashvalue.ljust(16, b'\x00')
+
+        h1 = int.from_bytes(hashvalue[:8], 'little')
+        h2 = int.from_bytes(hashvalue[8:16], 'little') | 1
+
+        return [(h1 + i * h2) % self.nbits for i in range(self.nhashes)]
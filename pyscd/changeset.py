@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+
+from collections import defaultdict
+import numpy as np
+
+
+class ChangeSet(object):
+    """The changes found by a dry run of SlowlyChangingDimension.update(),
+       kept in memory until they are applied to the table in one bulk
+       commit:
+       - patches: rows of the table modified in place, by coordinate.
+       - rows: new rows, either first versions of new members or new
+         versions of existing ones. Their key is assigned when applied.
+
+       Coordinates refer to the table as it was when the change set was
+       made, so it can only be applied while the table is unchanged. Once
+       applied, the change set is empty again.
+    """
+    def __init__(self, table, key, toatt, versionatt, currentatt, hashatt):
+        self.dtype = table.dtype
+        self.nrows = table.nrows
+        self.key = key
+        self.toatt = toatt
+        self.versionatt = versionatt
+        self.currentatt = currentatt
+        self.hashatt = hashatt
+
+        self.originals = {}
+        self.patches = {}
+        self.rows = []
+        self.members = defaultdict(list)
+
+    def read_coordinates(self, table, coords):
+        """Read rows of the table, with the patches applied.
+        """
+        rows = table.read_coordinates(coords)
+        for i, coord in enumerate(coords):
+            if coord in self.patches:
+                rows[i] = self.patches[coord]
+        return rows
+
+    def modify_coordinates(self, table, coords, rows):
+        """Record the new values of rows of the table.
+        """
+        missing = [coord for coord in coords if coord not in self.originals]
+        if missing:
+            for coord, row in zip(missing, table.read_coordinates(missing)):
+                self.originals[coord] = row
+
+        for coord, row in zip(coords, rows):
+            self.patches[coord] = row.copy()
+
+    def append(self, keyhashvalue):
+        """Stage a new row for a member and return it, to be filled.
+        """
+        row = np.zeros(1, dtype=self.dtype)
+        self.members[keyhashvalue].append(len(self.rows))
+        self.rows.append(row)
+        return row[0]
+
+    def staged(self, keyhashvalue):
+        """Return the rows staged for a member, as 1 row arrays that can be
+           modified in place.
+        """
+        return [self.rows[i] for i in self.members.get(keyhashvalue, [])]
+
+    def current(self, keyhashvalue):
+        """Return the staged current version of a member, or None.
+        """
+        for row in self.staged(keyhashvalue):
+            if row[self.currentatt][0]:
+                return row
+        return None
+
+    def check(self, table):
+        """Raise ValueError when the table changed since the change set was
+           made: rows were added or removed, or the rows to patch do not
+           hold their original values anymore, as after a compact() or an
+           update by another writer.
+        """
+        changed = table.nrows != self.nrows
+
+        if not changed and self.originals:
+            coords = np.array(sorted(self.originals), dtype=np.int64)
+            originals = np.empty(len(coords), dtype=self.dtype)
+            for i, coord in enumerate(coords):
+                originals[i] = self.originals[coord]
+            # Compared as raw bytes, as NaN is not equal to itself
+            changed = _raw(table.read_coordinates(coords)) != \
+                _raw(originals)
+
+        if changed:
+            raise ValueError('The table changed since the change set was '
+                             'made')
+
+    def apply(self, table, getnextid):
+        """Write the change set to the table: all patches with a single
+           modify_coordinates() and all new rows with a single append().
+        """
+        self.check(table)
+
+        if self.patches:
+            coords = np.array(sorted(self.patches), dtype=np.int64)
+            rows = np.empty(len(coords), dtype=self.dtype)
+            for i, coord in enumerate(coords):
+                rows[i] = self.patches[coord]
+            table.modify_coordinates(coords, rows)
+
+        if self.rows:
+            rows = np.concatenate(self.rows)
+            rows[self.key] = [getnextid() for i in range(len(rows))]
+            table.append(rows)
+
+        table.flush()
+
+        # Start over from the new state of the table
+        self.nrows = table.nrows
+        self.originals = {}
+        self.patches = {}
+        self.rows = []
+        self.members = defaultdict(list)
+
+    def to_dataframes(self):
+        """Return the change set as a dict of pandas DataFrames:
+           - 'new': First versions of new members.
+           - 'type1': Rows modified in place, with their 'coordinate' and the
+             'changed' columns, other than the hash and the SCD columns.
+           - 'type2_close': Rows inactivated, with their 'coordinate'.
+           - 'type2_open': New versions of existing members.
+        """
+        import pandas as pd
+
+        if self.rows:
+            rows = np.concatenate(self.rows)
+        else:
+            rows = np.empty(0, dtype=self.dtype)
+        first = rows[self.versionatt] == 1
+
+        # Valid to and current only change when a row is inactivated
+        scdcols = (self.toatt, self.currentatt, self.hashatt)
+
+        coords = sorted(self.patches)
+        patched = np.empty(len(coords), dtype=self.dtype)
+        changed = []
+        closed = np.zeros(len(coords), dtype=bool)
+        for i, coord in enumerate(coords):
+            original, patch = self.originals[coord], self.patches[coord]
+            patched[i] = patch
+            changed.append([col for col in self.dtype.names
+                            if col not in scdcols and
+                            _raw(original[col]) != _raw(patch[col])])
+            closed[i] = original[self.currentatt] and \
+                not patch[self.currentatt]
+
+        patches = pd.DataFrame(patched)
+        patches.insert(0, 'coordinate', coords)
+        patches['changed'] = changed
+
+        type1 = patches[[bool(cols) for cols in changed]]
+        type2close = patches[closed].drop(columns='changed')
+
+        return {'new': pd.DataFrame(rows[first]),
+                'type1': type1.reset_index(drop=True),
+                'type2_close': type2close.reset_index(drop=True),
+                'type2_open': pd.DataFrame(rows[~first])}
+
+
+def _raw(value):
+    """Return the bytes of a value or array, to compare values bit by bit.
+    """
+    return np.ascontiguousarray(value).tobytes()
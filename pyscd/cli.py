@@ -0,0 +1,342 @@
+# -*- coding: utf-8 -*-
+"""Command line interface of pyscd.
+
+    pyscd load SOURCE DIMENSION --lookup COLS [--type1 COLS] [--type2 COLS]
+
+SOURCE is a CSV file, a Parquet file or a key of an HDF5 file written by
+pandas, like orders.h5:/orders. DIMENSION is the node of the dimension
+table, like dim.h5:/dimorders/table. See pyscd load --help for the tuning
+options.
+"""
+
+import argparse
+import multiprocessing
+import sys
+import time
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    if not hasattr(args, 'func'):
+        parser.print_help()
+        return 2
+
+    return args.func(parser, args)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='pyscd',
+        description='Slowly Changing Dimension management')
+    subparsers = parser.add_subparsers()
+
+    load = subparsers.add_parser(
+        'load', help='Load a source into a dimension',
+        description='Load a source into a dimension and print a throughput '
+                    'summary.')
+    load.set_defaults(func=load_command)
+
+    load.add_argument('source',
+                      help='CSV file, Parquet file or HDF5 file and key, '
+                           'like orders.h5:/orders')
+    load.add_argument('dimension',
+                      help='HDF5 file and node of the dimension table, like '
+                           'dim.h5:/dimorders/table. With --shards, the '
+                           'group of the shard tables, or a path with a '
+                           '{shard} placeholder when each shard is in its '
+                           'own file.')
+
+    columns = load.add_argument_group('columns')
+    columns.add_argument('--lookup', type=_list, required=True,
+                         help='Comma separated lookup columns')
+    columns.add_argument('--type1', type=_list, default=[],
+                         help='Comma separated type 1 columns')
+    columns.add_argument('--type2', type=_list, default=[],
+                         help='Comma separated type 2 columns')
+    columns.add_argument('--type3', type=_mapping, default={},
+                         help='Comma separated type 3 columns and their '
+                              'previous value column, like status:previous')
+    columns.add_argument('--type6', type=_mapping, default={},
+                         help='Comma separated type 6 columns and their '
+                              'current value column, like status:current')
+
+    options = load.add_argument_group('dimension options')
+    options.add_argument('--asof',
+                         help='Valid from date of new versions, yyyy-MM-dd. '
+                              'Default today.')
+    options.add_argument('--binary-hash', action='store_true',
+                         help='The dimension stores binary hashes')
+    options.add_argument('--typed-hash', action='store_true',
+                         help='The dimension hashes typed values')
+    options.add_argument('--bloom-filter', action='store_true',
+                         help='Detect new members with a Bloom filter')
+
+    tuning = load.add_argument_group('tuning')
+    tuning.add_argument('--chunksize', type=int, default=100000,
+                        help='Source rows read at once. Default 100000.')
+    tuning.add_argument('--memory', type=int,
+                        help='Approximate memory cap in MB for a chunk of '
+                             'source rows, which lowers --chunksize if '
+                             'needed')
+    tuning.add_argument('--flush-every', type=int, default=100000,
+                        help='Rows between flushes of the dimension. '
+                             'Default 100000.')
+    tuning.add_argument('--shards', type=int, default=1,
+                        help='Number of shards of the dimension. Default 1.')
+    tuning.add_argument('--workers', type=int, default=1,
+                        help='Processes loading shards in parallel. Needs a '
+                             'dimension with a {shard} placeholder and '
+                             '--key-sequence. Default 1.')
+    tuning.add_argument('--key-sequence',
+                        help='File of the key sequence shared by all '
+                             'loaders')
+    tuning.add_argument('--key-block', type=int, default=1000,
+                        help='Keys reserved at once from the key sequence. '
+                             'Default 1000.')
+
+    return parser
+
+
+def load_command(parser, args):
+    if args.chunksize < 1 or args.flush_every < 1:
+        parser.error('--chunksize and --flush-every must be positive')
+    if args.shards < 1 or args.workers < 1:
+        parser.error('--shards and --workers must be positive')
+
+    if split_path(args.dimension)[1] is None:
+        parser.error('The dimension needs the node of its table, like '
+                     'dim.h5:/dimorders/table')
+
+    infiles = '{shard}' in args.dimension
+    if infiles and args.shards < 2:
+        parser.error('A {shard} placeholder needs --shards')
+    if infiles and not args.key_sequence:
+        parser.error('Shards in separate files need --key-sequence')
+    if args.workers > 1 and not infiles:
+        parser.error('--workers needs each shard in its own file, with a '
+                     '{shard} placeholder in the dimension path')
+
+    t0 = time.time()
+
+    if args.workers > 1:
+        workers = min(args.workers, args.shards)
+        jobs = [(args, list(range(i, args.shards, workers)))
+                for i in range(workers)]
+        pool = multiprocessing.Pool(workers)
+        try:
+            results = pool.map(_run_load_job, jobs)
+        finally:
+            pool.close()
+            pool.join()
+    elif infiles:
+        results = [run_load(args, list(range(args.shards)))]
+    else:
+        results = [run_load(args)]
+
+    elapsed = time.time() - t0
+
+    # Every worker reads the whole source
+    nrows = results[0]['rows']
+    counts = {name: sum(result[name] for result in results)
+              for name in ('new', 'type1', 'type2', 'type3')}
+    profile = results[0]['profile']
+    for result in results[1:]:
+        profile.merge(result['profile'])
+
+    print('rows      {:>12}'.format(nrows))
+    print('elapsed s {:>12.2f}'.format(elapsed))
+    print('rows/s    {:>12.0f}'.format(nrows / elapsed if elapsed else 0))
+    print('new       {:>12}'.format(counts['new']))
+    print('type 1    {:>12}'.format(counts['type1']))
+    print('type 2    {:>12}'.format(counts['type2']))
+    print('type 3    {:>12}'.format(counts['type3']))
+    print()
+    print(profile.report())
+
+    return 0
+
+
+def _run_load_job(job):
+    return run_load(*job)
+
+
+def run_load(args, shards=None):
+    """Load the source into the dimension. With shards, load only these
+       shards of a dimension with each shard in its own file, skipping the
+       rows of other shards. Returns the number of source rows, the update
+       counts and the merged profile.
+    """
+    import tables as tb
+    from pyscd.dimension import SlowlyChangingDimension
+    from pyscd.keys import FileKeySequence
+    from pyscd.sharded import ShardedDimension, shard_hash, shard_of
+
+    keyallocator = None
+    if args.key_sequence:
+        keyallocator = FileKeySequence(args.key_sequence,
+                                       blocksize=args.key_block)
+
+    kwargs = dict(type3atts=args.type3, type6atts=args.type6,
+                  binaryhash=args.binary_hash, typedhash=args.typed_hash,
+                  bloomfilter=args.bloom_filter, profile=True,
+                  asof=args.asof, keyallocator=keyallocator, verbose=False)
+
+    h5files = []
+    dims = {}
+    try:
+        if shards is not None:
+            for shard in shards:
+                filename, node = split_path(args.dimension.format(shard=shard))
+                h5files.append(tb.open_file(filename, mode='a'))
+                dims[shard] = SlowlyChangingDimension(
+                    h5files[-1].get_node(node),
+                    args.lookup, args.type1, args.type2, **kwargs)
+            table = dims[shards[0]].connection
+        else:
+            filename, node = split_path(args.dimension)
+            h5files.append(tb.open_file(filename, mode='a'))
+            node = h5files[-1].get_node(node)
+
+            if args.shards > 1:
+                tables = [node._f_get_child('shard{}'.format(i))
+                          for i in range(args.shards)]
+                dim = ShardedDimension(tables, args.lookup, args.type1,
+                                       args.type2, **kwargs)
+                dims = dict(enumerate(dim.shards))
+                table = tables[0]
+            else:
+                dims[0] = SlowlyChangingDimension(
+                    node, args.lookup, args.type1, args.type2, **kwargs)
+                table = node
+
+        anydim = dims[min(dims)]
+        chunksize = args.chunksize
+        if args.memory:
+            chunksize = max(1, min(chunksize,
+                                   args.memory * 2 ** 20 // table.rowsize))
+
+        nrows = 0
+        unflushed = 0
+        columns = anydim.attributes
+        for df in read_source(args.source, chunksize, table, columns):
+            for row in to_records(df, table, columns):
+                nrows += 1
+
+                if len(dims) == 1 and args.shards == 1:
+                    dim = anydim
+                else:
+                    shard = shard_of(shard_hash(row, args.lookup),
+                                     args.shards)
+                    dim = dims.get(shard)
+                    if dim is None:
+                        # Loaded by another worker
+                        continue
+
+                dim.update(row)
+                unflushed += 1
+
+                if unflushed >= args.flush_every:
+                    for dim in dims.values():
+                        dim.flush()
+                    unflushed = 0
+
+        for dim in dims.values():
+            dim.flush()
+
+        profile = anydim.profile
+        for dim in dims.values():
+            if dim is not anydim:
+                profile.merge(dim.profile)
+
+        return {'rows': nrows,
+                'new': sum(dim.new_rows for dim in dims.values()),
+                'type1': sum(dim.updated_type1_rows for dim in dims.values()),
+                'type2': sum(dim.updated_type2_rows for dim in dims.values()),
+                'type3': sum(dim.updated_type3_rows for dim in dims.values()),
+                'profile': profile}
+    finally:
+        for h5file in h5files:
+            h5file.close()
+
+
+def split_path(path):
+    """Split 'file.h5:/node' in the file name and the node. The node is None
+       when there is none.
+    """
+    if ':' in path:
+        filename, node = path.rsplit(':', 1)
+        if node.startswith('/'):
+            return filename, node
+    return path, None
+
+
+def read_source(source, chunksize, table, columns):
+    """Yield DataFrames of at most chunksize rows of the source columns.
+       Columns stored as strings in the table are read as strings from CSV
+       files, so codes like '00010' keep their leading zeros.
+    """
+    import pandas as pd
+
+    filename, key = split_path(source)
+
+    if key is not None:
+        with pd.HDFStore(filename, 'r') as store:
+            for df in store.select(key, columns=columns, chunksize=chunksize):
+                yield df
+    elif filename.endswith(('.parquet', '.pq')):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            df = pd.read_parquet(filename, columns=columns)
+            for start in range(0, len(df), chunksize):
+                yield df[start:start + chunksize]
+        else:
+            parquet = pq.ParquetFile(filename)
+            for batch in parquet.iter_batches(batch_size=chunksize,
+                                              columns=columns):
+                yield batch.to_pandas()
+    else:
+        dtypes = {col: str for col in columns
+                  if table.coldtypes[col].kind == 'S'}
+        for df in pd.read_csv(filename, usecols=columns, dtype=dtypes,
+                              chunksize=chunksize):
+            yield df
+
+
+def to_records(df, table, columns):
+    """Convert the columns of a DataFrame to the types of the table, with
+       strings as bytes, and return them as a numpy record array.
+    """
+    df = df[columns].copy()
+
+    for col in columns:
+        dtype = table.coldtypes[col]
+        if dtype.kind == 'S':
+            df[col] = [value if isinstance(value, bytes)
+                       else str(value).encode('utf-8')
+                       for value in df[col].fillna('')]
+        else:
+            df[col] = df[col].astype(dtype)
+
+    return df.to_records(index=False)
+
+
+def _list(value):
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+def _mapping(value):
+    mapping = {}
+    for item in _list(value):
+        if ':' not in item:
+            raise argparse.ArgumentTypeError(
+                'Expected column:column, got {!r}'.format(item))
+        att, other = item.split(':', 1)
+        mapping[att] = other
+    return mapping
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,23 +1,33 @@
 # -*- coding: utf-8 -*-
 
 import datetime
-import pandas as pd
+import os
+import tempfile
 import numpy as np
 import tables as tb
-import hashlib
 from collections import defaultdict
+from pyscd.bloom import BloomFilter
+from pyscd.changeset import ChangeSet
+from pyscd.hashing import compute_hash
+from pyscd.profiling import LoadProfile, NullProfile
 from pyscd.progress import Progress
 import logging
-logging.basicConfig(level=logging.DEBUG)
 log = logging.getLogger(__name__)
 
 
 class SlowlyChangingDimension(object):
-    """A class for accessing a slowly changing dimension of types 1 and 2.
+    """A class for accessing a slowly changing dimension of types 1, 2, 3
+       and 6.
     """
 
+    # Runs of consecutive rows above which in-place writes on an indexed
+    # table are done with a single modify_coordinates()
+    MAX_MODIFY_RUNS = 32
+
     def __init__(self, connection,
                  lookupatts, type1atts, type2atts,
+                 type3atts=None,
+                 type6atts=None,
                  key='scd_id',
                  fromatt='scd_valid_from',
                  toatt='scd_valid_to',
@@ -25,7 +35,13 @@ class SlowlyChangingDimension(object):
                  versionatt='scd_version',
                  currentatt='scd_current',
                  hashatt='scd_hash',
+                 binaryhash=False,
+                 typedhash=False,
+                 bloomfilter=False,
+                 dryrun=False,
+                 profile=False,
                  asof=None,
+                 keyallocator=None,
                  verbose=True):
         """
         Parameters
@@ -52,6 +68,18 @@ class SlowlyChangingDimension(object):
         type2atts
             Required. A list of the columns that should have version tracking.
 
+        type3atts
+            Optional. A dict mapping the columns that should be overwritten in
+            all versions, like type 1, to the column that keeps their previous
+            value, like {'status': 'previous_status'}.
+            Default None.
+
+        type6atts
+            Optional. A dict mapping the columns that should have version
+            tracking, like type 2, to the column that keeps their current
+            value in all versions, like {'status': 'current_status'}.
+            Default None.
+
         key
             Optional. String with the name of the primary key of the dimension
             table.
@@ -86,12 +114,53 @@ class SlowlyChangingDimension(object):
             the attributes of each row.
             Default 'scd_hash'.
 
+        binaryhash
+            Optional. Store the hash as a 16 bytes binary digest instead of a
+            40 characters hex string. The hash column can then be declared as
+            tb.StringCol(16). See migrate_hashes() for existing tables.
+            Default False.
+
+        typedhash
+            Optional. Encode the values by type before hashing them, so
+            values of different types never collide and floats are not
+            formatted as strings. See migrate_hashes() for existing tables.
+            Default False.
+
+        bloomfilter
+            Optional. Keep a Bloom filter over the key hashes, so new members
+            are told apart without probing the index of current versions.
+            * False: No filter.
+            * True: A filter sized for twice the current members, and at
+                    least one million.
+            * Integer: A filter sized for this number of members.
+            Default False.
+
+        dryrun
+            Optional. Do not write to the table. All changes found by update()
+            are kept in the change set, which can be previewed with
+            changeset.to_dataframes() and later written with apply().
+            Default False.
+
+        profile
+            Optional. Time the internal phases of update() and count the
+            rows read and written. The results are kept in the profile
+            attribute, a pyscd.profiling.LoadProfile, see its report().
+            Default False.
+
         asof
             Optional. The date to use for fromatt for the 1st version of a row.
             * None: Uses current date.
             * String: Uses this value. Must be a date string in the format
                       'yyyy-MM-dd'.
             Default None.
+
+        keyallocator
+            Optional. A pyscd.keys.KeyAllocator used to assign the key of new
+            rows. Use a FileKeySequence shared by all loaders when several
+            processes write to the same dimension. It is advanced past the
+            highest key of the table.
+            * None: Increments the key of the last row of the table.
+            Default None.
         """
         if not isinstance(key, str):
             raise ValueError('Key argument must be a string')
@@ -101,6 +170,10 @@ class SlowlyChangingDimension(object):
             raise ValueError('Type 1 attributes argument must be a list')
         if not isinstance(type2atts, list):
             raise ValueError('Type 2 attributes argument must be a list')
+        if type3atts is not None and not isinstance(type3atts, dict):
+            raise ValueError('Type 3 attributes argument must be a dict')
+        if type6atts is not None and not isinstance(type6atts, dict):
+            raise ValueError('Type 6 attributes argument must be a dict')
         if not isinstance(connection, tb.Table):
             raise TypeError('Connection argument must be a PyTables table')
 
@@ -108,29 +181,51 @@ class SlowlyChangingDimension(object):
         self.lookupatts = lookupatts
         self.type1atts = type1atts
         self.type2atts = type2atts
-        self.attributes = lookupatts + type1atts + type2atts
+        self.type3atts = type3atts or {}
+        self.type6atts = type6atts or {}
+        self.attributes = lookupatts + type1atts + type2atts +\
+            list(self.type3atts) + list(self.type6atts)
         self.key = key
         self.fromatt = fromatt
         self.toatt = toatt
         self.versionatt = versionatt
         self.currentatt = currentatt
         self.hashatt = hashatt
+        self.binaryhash = binaryhash
+        self.typedhash = typedhash
+        self.bloomfilter = bloomfilter
+        self.dryrun = dryrun
+        self.keyallocator = keyallocator
+        self.maxidattr = 'scd_maxid'
         self.verbose = verbose
 
         if not asof:
-            today = datetime.date.today()
-            self.asof = pd.to_datetime([today]).astype(np.int64)[0]
+            self.asof = _to_timestamp(datetime.date.today())
         else:
-            self.asof = pd.to_datetime([asof],
-                yearfirst=True, dayfirst=False).astype(np.int64)[0]
+            self.asof = _to_timestamp(asof)
 
-        self.maxto = pd.to_datetime([maxto],
-            yearfirst=True, dayfirst=False).astype(np.int64)[0]
+        self.maxto = _to_timestamp(maxto)
+
+        self.changeset = None
+        if dryrun:
+            self.changeset = ChangeSet(connection, key, toatt, versionatt,
+                                       currentatt, hashatt)
+
+        # Key hashes of the rows appended and not flushed yet, which
+        # queries can not see
+        self.__unflushed = set()
+
+        self.profile = None
+        self.__timer = NullProfile()
+        if profile:
+            self.profile = LoadProfile(connection.rowsize)
+            self.__timer = self.profile
 
         # Initialize updated count info
         self._new_count = 0
         self._type1_modified_count = 0
         self._type2_modified_count = 0
+        self._type3_modified_count = 0
 
         self._v_string_type = [k for k, v in
                                self.connection.description._v_types.items()
@@ -152,47 +247,43 @@ class SlowlyChangingDimension(object):
             self.allkeyslookupcondition +\
             ' & ({!s} == True)'.format(self.currentatt)
 
+        # This gives (lookupatt1 >= __lower) & (lookupatt1 <= __upper)
+        # Used by lookup_many() to read a block of sorted keys at once.
+        # PyTables caches the compiled condition by its string, so keeping
+        # the same strings for all queries compiles each of them once.
+        self.rangelookupcondition = \
+            '({0!s} >= __lower) & ({0!s} <= __upper)'.format(
+                self.lookupatts[0])
+
+        # The same, and (currentatt == True)
+        self.currentrangelookupcondition =\
+            self.rangelookupcondition +\
+            ' & ({!s} == True)'.format(self.currentatt)
+
         # Get the last used key
+        self.__maxid = 0
         try:
             # Select the key id of the last row.
             self.__maxid = connection[-1:][self.key][0]
         except IndexError:
-            # The table is empty, so we set __maxid to 0
-            self.__maxid = 0
-
-        # Load index
-        # The same query with pandas is so fast
-        # https://github.com/pydata/pandas/blob/master/pandas/io/pytables.py
-        log.debug('Loading dimension indexes with Pandas...')
-        self.__hashtable = defaultdict(list)
+            # The table is empty, so we keep __maxid as 0
+            pass
 
-        df = pd.read_hdf('gpi.h5', 'dimordens',
-                         #where='scd_current == {!s}'.format('1'),
-                         columns=self.lookupatts + [self.hashatt])
-        df = df[df[self.currentatt] == True]
+        # Rows are no longer in key order after compact(), which saves
+        # the highest key in the same attribute as TableKeyAllocator.
+        if self.maxidattr in connection.attrs:
+            self.__maxid = max(self.__maxid,
+                               connection.attrs[self.maxidattr])
 
+        # An allocator must not hand out keys already in the table
+        if self.keyallocator:
+            self.keyallocator.advance(int(self.__maxid))
 
-        log.debug('Loading dimension indexes with PyTables...')
-
-        indexes = self.connection.get_where_list('({!s} == True)'.
-            format(self.currentatt))
-
-        i = 0
-        n = len(indexes)
-        with Progress(n) as p:
-            for index in indexes:
-                if self.verbose:
-                    p.update(i)
-                    i += 1
-
-                row = self.connection[index]
-                rowhashvalue = row[self.hashatt].decode()
-                keyhashvalue = self._compute_hash_key(row)
-
-                self.__hashtable[keyhashvalue].append(rowhashvalue)
+        # Load index
+        self.__load_index()
 
     def __exit__(self):
-        self.connection.flush()
+        self.flush()
 
     @property
     def new_rows(self):
@@ -206,122 +297,703 @@ class SlowlyChangingDimension(object):
     def updated_type2_rows(self):
         return self._type2_modified_count
 
+    @property
+    def updated_type3_rows(self):
+        return self._type3_modified_count
+
+    def flush(self):
+        """Flush the rows written to the table.
+        """
+        with self.__timer.phase('flush'):
+            self.connection.flush()
+        self.__unflushed.clear()
+
     def lookup(self, tablerow):
         """Read the newest version of the row.
+           In dry run mode, changes in the change set are taken into account.
         """
         condvars = {'_' + att: tablerow[att] for att in self.lookupatts}
 
-        row = self.connection.read_where(
-            self.currentkeylookupcondition, condvars)
+        if self.dryrun:
+            row = self.changeset.current(self._compute_hash_key(tablerow))
+            if row is not None:
+                # A copy, as staged rows are modified in place
+                return row.copy()
+
+            coords = self.connection.get_where_list(
+                self.currentkeylookupcondition, condvars)
+            row = self.changeset.read_coordinates(self.connection, coords)
+            row = row[row[self.currentatt]]
+        else:
+            row = self.connection.read_where(
+                self.currentkeylookupcondition, condvars)
+        self.__timer.read(len(row))
 
-        if row:
+        if len(row):
             return row
         return None
 
+    def apply(self):
+        """Write the change set of a dry run to the table in one bulk commit.
+           Afterwards, the dimension keeps working in dry run mode with an
+           empty change set.
+        """
+        if not self.dryrun:
+            raise ValueError('There is no change set out of dry run mode')
+
+        self.changeset.apply(self.connection, self._getnextid)
+
+    def lookup_many(self, tablerows, current=True, blocksize=256):
+        """Read the newest version, or all versions when current is False,
+           of many rows at once. Returns a dict from the key hash of each row
+           found to an array with its versions.
+
+           The values of the first lookup attribute are sorted and split in
+           blocks of blocksize keys, and each block is read with a single
+           range query, so a block costs one table traversal or index range
+           scan instead of one query per row.
+        """
+        wanted = {}
+        for row in tablerows:
+            values = {att: row[att] for att in self.lookupatts}
+            wanted[self._compute_hash_key(values)] = values
+
+        if self.dryrun:
+            # Staged changes are not in the table
+            found = {}
+            for keyhashvalue, values in wanted.items():
+                if current:
+                    row = self.lookup(values)
+                else:
+                    condvars = self._build_condvars(values)
+                    coords = self.connection.get_where_list(
+                        self.allkeyslookupcondition, condvars)
+                    row = self.changeset.read_coordinates(self.connection,
+                                                          coords)
+                    staged = self.changeset.staged(keyhashvalue)
+                    row = np.concatenate([row] + staged)
+                if row is not None and len(row):
+                    found[keyhashvalue] = row
+            return found
+
+        # Rows appended since the last flush are not seen by queries
+        if self.__unflushed:
+            self.flush()
+
+        if current:
+            condition = self.currentrangelookupcondition
+        else:
+            condition = self.rangelookupcondition
+
+        first = self.lookupatts[0]
+        keys = np.unique([values[first] for values in wanted.values()])
+
+        found = defaultdict(list)
+        for start in range(0, len(keys), blocksize):
+            block = keys[start:start + blocksize]
+            condvars = {'__lower': block[0], '__upper': block[-1]}
+
+            rows = self.connection.read_where(condition, condvars)
+            self.__timer.read(len(rows))
+
+            # Keys in the range that were not asked for
+            rows = rows[np.isin(rows[first], block)]
+
+            for row in rows:
+                keyhashvalue = self._compute_hash_key(row)
+                if keyhashvalue in wanted:
+                    found[keyhashvalue].append(row)
+
+        return {keyhashvalue: np.array(rows, dtype=self.connection.dtype)
+                for keyhashvalue, rows in found.items()}
+
     def update(self, row):
         """Update the dimension by inserting new rows, modifying type 1
            attributes and adding a new version of modified rows.
         """
-        keyhashvalue = self._compute_hash_key(row)
-        rowhashvalue = self._compute_hash_row(row)
-
-        if not keyhashvalue in self.__hashtable:
+        timer = self.__timer
+
+        with timer.phase('hash'):
+            keyhashvalue = self._compute_hash_key(row)
+            rowhashvalue = self._compute_hash_row(row)
+
+        with timer.phase('probe'):
+            if self.__bloom is not None and keyhashvalue not in self.__bloom:
+                # The filter guarantees it is a new member
+                isnew = True
+            else:
+                isnew = keyhashvalue not in self.__hashtable
+            known = not isnew and \
+                rowhashvalue in self.__hashtable[keyhashvalue]
+
+        if isnew:
             # It is a new member. We add the first version.
             self.insert(row)
             self._new_count += 1
-        elif not rowhashvalue in self.__hashtable[keyhashvalue]:
+        elif not known:
             # There is an existing version, but with a different hash.
 
+            # The newest version may have been appended since the last flush
+            if keyhashvalue in self.__unflushed:
+                self.flush()
+
             # Get the newest version
-            other = self.lookup(row)
-
-            # Check for modified type 1 attributes
-            for att in self.type1atts:
-                if row[att] != other[att]:
-                    self.__perform_type1_updates(row, other)
-                    self._type1_modified_count += 1
-                    break
-
-            # Check for modified type 2 attributes
-            for att in self.type2atts:
-                # Is it still necessary to check for null values?
-                # All string columns are store as bytes b'text' now,
-                # so I'm removing this from the condition:
-                # (pd.notnull(row[att]) or pd.notnull(other[att]))
-                if row[att] != other[att]:
-                    self.__track_type2_history(row, other)
-                    self._type2_modified_count += 1
-                    break
-
-    def insert(self, rowdata, version=1):
-        """Insert the given row.
+            with timer.phase('lookup'):
+                other = self.lookup(row)[0]
+
+            type1changed = self.__changed(row, other, self.type1atts)
+            type3changed = self.__changed(row, other, self.type3atts)
+            type2changed = self.__changed(
+                row, other, self.type2atts + list(self.type6atts))
+
+            if type1changed or type3changed or \
+               (type2changed and (self.type6atts or self.dryrun)):
+                # All versions are rewritten in a single pass, which also
+                # inactivates the current one when a new version is needed.
+                # Dry runs always take this path, as the current version may
+                # be one staged in the change set.
+                with timer.phase('type1'):
+                    self.__perform_type1_updates(row, other,
+                                                 close=type2changed)
+                if type2changed:
+                    self.__track_type2_history(row, other, close=False)
+            elif type2changed:
+                self.__track_type2_history(row, other)
+
+            if type1changed:
+                self._type1_modified_count += 1
+            if type3changed:
+                self._type3_modified_count += 1
+            if type2changed:
+                self._type2_modified_count += 1
+
+    def insert(self, rowdata, version=1, other=None):
+        """Insert the given row. When it is a new version of a member, other
+           is its current version, from which the previous values of type 3
+           attributes are carried over.
         """
+        with self.__timer.phase('append'):
+            self.__insert(rowdata, version, other)
+
+    def __insert(self, rowdata, version, other):
         keyhashvalue = self._compute_hash_key(rowdata)
         rowhashvalue = self._compute_hash_row(rowdata)
         self.__hashtable[keyhashvalue].append(rowhashvalue)
+        if self.__bloom is not None:
+            self.__bloom.add(keyhashvalue)
 
-        row = self.connection.row
+        if self.dryrun:
+            row = self.changeset.append(keyhashvalue)
+        else:
+            row = self.connection.row
 
         # Fill new row columns
         for col in self.attributes:
             row[col] = rowdata[col]
 
-        # Fill SCD columns
-        row[self.key] = self._getnextid()
+        for att, currentvalueatt in self.type6atts.items():
+            row[currentvalueatt] = rowdata[att]
+
+        if other is not None:
+            for previousatt, value in \
+                self.__type3_previous(rowdata, other).items():
+                row[previousatt] = value
+
+        # Fill SCD columns. Keys of a dry run are assigned when applied.
+        if not self.dryrun:
+            row[self.key] = self._getnextid()
         row[self.fromatt] = self.asof
         row[self.toatt] = self.maxto
         row[self.versionatt] = version
         row[self.currentatt] = True
         row[self.hashatt] = rowhashvalue
 
-        row.append()
+        if not self.dryrun:
+            row.append()
+            self.__timer.written(1)
+            self.__unflushed.add(keyhashvalue)
+
+    def compact(self, keep=None, newer_than=None, merge=True):
+        """Apply retention rules to the version history and rewrite the
+           table sorted by lookup attributes and valid from date.
+           Returns the number of rows removed.
+
+           The key of surviving rows does not change. The current version
+           of each member is always kept.
 
-    def __perform_type1_updates(self, rowdata, other):
-        """Find and update all rows with same Lookup Attributes.
+           The whole table is read into memory and rewritten in place, so
+           the file should be backed up before compacting.
+
+        Parameters
+        ----------
+
+        keep
+            Optional. Maximum number of versions to keep per member.
+            * None: Keeps all versions.
+            Default None.
+
+        newer_than
+            Optional. Drop versions that stopped being valid before this
+            date. Must be a date string in the format 'yyyy-MM-dd'.
+            * None: Keeps versions of any date.
+            Default None.
+
+        merge
+            Optional. Merge adjacent versions of a member whose type 2
+            attributes are identical into a single version, which keeps the
+            key, valid from date and version number of the earliest one.
+            Default True.
+        """
+        if keep is not None and (not isinstance(keep, int) or keep < 1):
+            raise ValueError('Keep argument must be a positive integer')
+        if self.dryrun:
+            raise ValueError('A dimension in dry run mode can not be '
+                             'compacted')
+
+        # Rows appended since the last flush are not read otherwise
+        self.flush()
+
+        rows = self.connection.read()
+        n = len(rows)
+        if not n:
+            return 0
+
+        maxid = int(rows[self.key].max())
+        rows.sort(order=self.lookupatts + [self.fromatt, self.versionatt])
+
+        # True for the first version of each member
+        first = np.zeros(n, dtype=bool)
+        first[0] = True
+        for att in self.lookupatts:
+            first[1:] |= rows[att][1:] != rows[att][:-1]
+
+        if merge:
+            # A version is merged into the previous one of the same member
+            # when all type 2 attributes are the same
+            same = ~first
+            for att in self.type2atts + list(self.type6atts):
+                same[1:] &= rows[att][1:] == rows[att][:-1]
+
+            # Each survivor takes the values of the last version of its run
+            survivors = np.flatnonzero(~same)
+            ends = np.append(survivors[1:], n) - 1
+            merged = rows[ends]
+            for att in (self.key, self.fromatt, self.versionatt):
+                merged[att] = rows[att][survivors]
+
+            rows = merged
+            first = first[survivors]
+            n = len(rows)
+
+        retain = np.ones(n, dtype=bool)
+
+        if keep is not None:
+            # Position of each version counting from the newest one
+            last = np.flatnonzero(np.append(first[1:], True))
+            member = np.cumsum(first) - 1
+            retain &= last[member] - np.arange(n) < keep
+
+        if newer_than is not None:
+            cutoff = _to_timestamp(newer_than)
+            retain &= (rows[self.toatt] > cutoff) | rows[self.currentatt]
+
+        rows = rows[retain]
+        removed = len(self.connection) - len(rows)
+
+        # Keys of removed rows are not handed out again
+        if self.maxidattr in self.connection.attrs:
+            maxid = max(maxid, int(self.connection.attrs[self.maxidattr]))
+        self.connection.attrs[self.maxidattr] = maxid
+        if not self.keyallocator:
+            self.__maxid = max(self.__maxid, maxid)
+
+        self.connection.truncate(0)
+        self.connection.append(rows)
+        self.connection.flush()
+
+        if self.connection.indexed:
+            self.connection.reindex()
+
+        self.__load_index()
+        return removed
+
+    def verify(self, chunksize=1000000, hashes=True):
+        """Check the invariants of the dimension over the whole table and
+           return the coordinates of the rows violating each of them:
+           - 'stale_hash': The stored hash does not match the attributes.
+             Only checked when hashes is True.
+           - 'multiple_current': A current row that is not the newest
+             version of its member.
+           - 'no_current': The newest version of a member that has no
+             current row.
+           - 'gap': A version ending before the next one starts.
+           - 'overlap': A version ending after the next one starts.
+
+           The table is read in chunks of chunksize rows. Members are told
+           apart by a 128 bit hash of their lookup attributes computed with
+           vectorized operations. When the table has more than chunksize
+           rows, the SCD columns of each chunk are spread by that hash over
+           partitions of about chunksize rows, in temporary files of about
+           45 bytes per row, and the versions of each partition are sorted
+           and checked in memory. Memory use is thus bounded by chunksize,
+           about 100 bytes per row plus a chunk of the table, and by the
+           number of violations found.
+
+           Hashing the attributes of each row to check the stored hash is
+           by far the slowest part. With hashes False, only the structural
+           checks are done.
+        """
+        return self.__check(chunksize, hashes)[0]
+
+    def repair(self, chunksize=1000000, hashes=True):
+        """Fix the violations found by verify() in bulk and return them:
+           - Recompute stale hashes, when hashes is True.
+           - Make the newest version of each member the only current one,
+             valid until maxto when it was not current.
+           - Make each other version valid until the next one starts.
+        """
+        if self.dryrun:
+            raise ValueError('A dimension in dry run mode can not be '
+                             'repaired')
+
+        violations, fixes = self.__check(chunksize, hashes)
+        coords, toatts, currents = fixes
+
+        stale = violations['stale_hash']
+        for start in range(0, len(stale), chunksize):
+            block = stale[start:start + chunksize]
+            rows = self.connection.read_coordinates(block)
+            for row in rows:
+                row[self.hashatt] = self._compute_hash_row(row)
+            self.connection.modify_coordinates(block, rows)
+
+        for start in range(0, len(coords), chunksize):
+            block = slice(start, start + chunksize)
+            rows = self.connection.read_coordinates(coords[block])
+            rows[self.toatt] = toatts[block]
+            rows[self.currentatt] = currents[block]
+            self.connection.modify_coordinates(coords[block], rows)
+
+        self.flush()
+        self.__load_index()
+        return violations
+
+    def __check(self, chunksize, hashes):
+        """Return the violations of verify() and the fixes of repair(): the
+           coordinates, valid to dates and current flags of the rows to fix.
+        """
+        self.flush()
+
+        table = self.connection
+        n = table.nrows
+        coldtypes = table.coldtypes
+        dtype = np.dtype([('key', '<u8', (2,)), ('coord', '<i8'),
+                          ('from', coldtypes[self.fromatt]),
+                          ('to', coldtypes[self.toatt]),
+                          ('version', coldtypes[self.versionatt]),
+                          ('current', coldtypes[self.currentatt])])
+
+        npartitions = max(1, -(-n // chunksize))
+        stale = []
+        results = []
+
+        with tempfile.TemporaryDirectory(prefix='pyscd') as tmpdir:
+            paths = [os.path.join(tmpdir, str(i))
+                     for i in range(npartitions)]
+
+            for start in range(0, n, chunksize):
+                rows = table.read(start, start + chunksize)
+
+                if hashes:
+                    for i, row in enumerate(rows):
+                        rowhashvalue = self._compute_hash_row(row)
+                        if not self.binaryhash:
+                            rowhashvalue = rowhashvalue.encode()
+                        if row[self.hashatt] != rowhashvalue:
+                            stale.append(start + i)
+
+                versions = np.empty(len(rows), dtype=dtype)
+                versions['key'] = _member_keys(rows, self.lookupatts)
+                versions['coord'] = np.arange(start, start + len(rows))
+                versions['from'] = rows[self.fromatt]
+                versions['to'] = rows[self.toatt]
+                versions['version'] = rows[self.versionatt]
+                versions['current'] = rows[self.currentatt]
+
+                if npartitions == 1:
+                    results.append(self.__check_versions(versions))
+                    continue
+
+                # Spread the versions over partitions by member
+                partition = versions['key'][:, 0] % np.uint64(npartitions)
+                order = np.argsort(partition, kind='stable')
+                bounds = np.searchsorted(partition[order],
+                                         np.arange(npartitions + 1))
+                for i, path in enumerate(paths):
+                    block = versions[order[bounds[i]:bounds[i + 1]]]
+                    if len(block):
+                        with open(path, 'ab') as f:
+                            block.tofile(f)
+
+            if npartitions > 1:
+                for path in paths:
+                    if os.path.exists(path):
+                        results.append(self.__check_versions(
+                            np.fromfile(path, dtype=dtype)))
+
+        names = ('multiple_current', 'no_current', 'gap', 'overlap')
+        violations = {'stale_hash': np.array(stale, dtype=np.int64)}
+        for i, name in enumerate(names):
+            violations[name] = np.sort(np.concatenate(
+                [np.empty(0, dtype=np.int64)] +
+                [result[0][i] for result in results]))
+
+        coords = np.concatenate([np.empty(0, dtype=np.int64)] +
+                                [result[1][0] for result in results])
+        toatts = np.concatenate([np.empty(0, dtype=dtype['to'])] +
+                                [result[1][1] for result in results])
+        currents = np.concatenate([np.empty(0, dtype=bool)] +
+                                  [result[1][2] for result in results])
+        order = np.argsort(coords)
+        fixes = (coords[order], toatts[order], currents[order])
+
+        return violations, fixes
+
+    def __check_versions(self, versions):
+        """Check the versions of whole members, as built by __check(), and
+           return the coordinates violating each structural invariant and
+           the fixes of the rows to repair.
+        """
+        n = len(versions)
+
+        # Sort by member, valid from date and version
+        keys = versions['key']
+        order = np.lexsort((versions['version'], versions['from'],
+                            keys[:, 1], keys[:, 0]))
+        versions = versions[order]
+        keys = versions['key']
+        coords = versions['coord']
+        fromatts = versions['from']
+        toatts = versions['to']
+        currents = versions['current']
+
+        # True for the newest version of each member
+        last = np.ones(n, dtype=bool)
+        last[:-1] = (keys[1:] != keys[:-1]).any(axis=1)
+
+        # Valid from date of the next version of the same member
+        nextfrom = np.empty(n, dtype=fromatts.dtype)
+        nextfrom[:-1] = fromatts[1:]
+        nextfrom[last] = 0
+
+        violations = (coords[currents & ~last],
+                      coords[last & ~currents],
+                      coords[~last & (toatts < nextfrom)],
+                      coords[~last & (toatts > nextfrom)])
+
+        fixedtoatts = np.where(last, np.where(currents, toatts, self.maxto),
+                               nextfrom)
+        fix = (fixedtoatts != toatts) | (last != currents)
+        fixes = (coords[fix], fixedtoatts[fix], last[fix])
+
+        return violations, fixes
+
+    def __perform_type1_updates(self, rowdata, other, close=False):
+        """Find and update all rows with same Lookup Attributes, in a single
+           read and write of the rows:
+           - Overwrite type 1 attributes.
+           - Overwrite type 3 attributes, keeping the previous value.
+           - Overwrite the current value of type 6 attributes.
+           - When close is True, inactivate the current row, like
+             __track_type2_history does.
         """
         condvars = self._build_condvars(rowdata)
 
         # Find coordinates of all rows using lookup columns
         coords = self.connection.get_where_list(
             self.allkeyslookupcondition, condvars)
-        rows = self.connection.read_coordinates(coords)
 
+        self.__timer.read(len(coords))
+
+        if self.dryrun:
+            rows = self.changeset.read_coordinates(self.connection, coords)
+            self.__patch(rows, rowdata, other, close)
+            self.changeset.modify_coordinates(self.connection, coords, rows)
+
+            # New versions staged by this dry run
+            for staged in self.changeset.staged(
+                    self._compute_hash_key(rowdata)):
+                self.__patch(staged, rowdata, other, close)
+        else:
+            rows = self.connection.read_coordinates(coords)
+            self.__patch(rows, rowdata, other, close)
+
+            # Update dimension
+            self.__modify_coordinates(coords, rows)
+            self.__timer.written(len(coords))
+
+        if not close:
+            keyhashvalue = self._compute_hash_key(rowdata)
+            self.__hashtable[keyhashvalue].append(
+                self._compute_hash_row(rowdata))
+
+    def __modify_coordinates(self, coords, rows):
+        """Write rows of the table in place, other than their lookup
+           attributes, which do not change.
+
+           On an indexed table, Table.modify_coordinates() rebuilds every
+           index, and doing so overwrites the rows appended and not flushed
+           yet. When the columns written are not indexed and the rows form
+           at most MAX_MODIFY_RUNS runs of consecutive coordinates, each run
+           is written with one modify_columns(), which leaves the indexes
+           alone. Otherwise pending rows are flushed and all the rows are
+           written with a single modify_coordinates().
+        """
+        table = self.connection
+
+        if table.indexed:
+            names = [col for col in rows.dtype.names
+                     if col not in self.lookupatts]
+
+            order = np.argsort(coords, kind='stable')
+            coords = np.asarray(coords)[order]
+            rows = rows[order]
+            starts = np.flatnonzero(np.diff(coords) != 1) + 1
+            bounds = np.concatenate(([0], starts, [len(coords)]))
+
+            if len(bounds) - 1 <= self.MAX_MODIFY_RUNS and \
+               not any(table.colindexed[col] for col in names):
+                for first, last in zip(bounds[:-1], bounds[1:]):
+                    table.modify_columns(
+                        int(coords[first]), int(coords[last - 1]) + 1,
+                        columns=[rows[col][first:last] for col in names],
+                        names=names)
+                return
+
+            if self.__unflushed:
+                self.flush()
+
+        table.modify_coordinates(coords, rows)
+
+    def __patch(self, rows, rowdata, other, close):
+        """Apply the changes of __perform_type1_updates to rows of a member.
+        """
         # Update type 1 attributes
         for type1att in self.type1atts:
             rows[type1att][:] = rowdata[type1att]
 
+        # Update type 3 attributes and their previous values
+        for type3att in self.type3atts:
+            rows[type3att][:] = rowdata[type3att]
+        previous = self.__type3_previous(rowdata, other)
+        for previousatt, value in previous.items():
+            rows[previousatt][:] = value
+
+        # Update current value of type 6 attributes
+        for type6att, currentvalueatt in self.type6atts.items():
+            rows[currentvalueatt][:] = rowdata[type6att]
+
+        if close:
+            current = rows[self.currentatt]
+            rows[self.toatt][current] = self.asof
+            rows[self.currentatt][current] = False
+
         # Update hash
         for row in rows:
             row[self.hashatt] = self._compute_hash_row(row)
 
-        # Update dimension
-        self.connection.modify_coordinates(coords, rows)
-
-    def __track_type2_history(self, tablerow, other):
+    def __track_type2_history(self, tablerow, other, close=True):
         """Track history of type 2 columns. The following actions are performed:
-           - Find the current active row and inactivate it:
+           - Find the current active row and inactivate it, unless close is
+             False because __perform_type1_updates already did it:
              - Set valid to attribute to asof.
              - Set current attribute to False.
            - Insert a new version.
         """
-        condvars = self._build_condvars(tablerow)
+        if close:
+            with self.__timer.phase('type2_close'):
+                condvars = self._build_condvars(tablerow)
 
-        # Find coordinates of the current row using lookup columns
-        coord = self.connection.get_where_list(
-            self.currentkeylookupcondition, condvars)
-        row = self.connection.read_coordinates(coord)
+                # Find coordinates of the current row using lookup columns
+                coord = self.connection.get_where_list(
+                    self.currentkeylookupcondition, condvars)
+                row = self.connection.read_coordinates(coord)
 
-        # Update valid to and current columns
-        row[self.toatt] = self.asof
-        row[self.currentatt] = False
+                # Update valid to and current columns
+                row[self.toatt] = self.asof
+                row[self.currentatt] = False
 
-        # Update dimension
-        self.connection.modify_coordinates(coord, row)
+                # Update dimension
+                self.__modify_coordinates(coord, row)
+                self.__timer.read(len(coord))
+                self.__timer.written(len(coord))
 
         # Insert new version of the row
-        self.insert(tablerow, version=other[self.versionatt] + 1)
+        self.insert(tablerow, version=other[self.versionatt] + 1, other=other)
+
+    def __changed(self, row, other, atts):
+        """Tell if any of the given attributes differ between the rows.
+        """
+        for att in atts:
+            # Is it still necessary to check for null values?
+            # All string columns are store as bytes b'text' now,
+            # so I'm removing this from the condition:
+            # (pd.notnull(row[att]) or pd.notnull(other[att]))
+            if row[att] != other[att]:
+                return True
+        return False
+
+    def __type3_previous(self, rowdata, other):
+        """Return the previous value column of each type 3 attribute, given
+           the new row and the current version.
+        """
+        previous = {}
+        for att, previousatt in self.type3atts.items():
+            if rowdata[att] != other[att]:
+                previous[previousatt] = other[att]
+            else:
+                previous[previousatt] = other[previousatt]
+        return previous
+
+    def __load_index(self):
+        """Load the hashes of the current version of each member.
+        """
+        self.__hashtable = defaultdict(list)
+
+        log.debug('Loading dimension indexes with PyTables...')
+
+        indexes = self.connection.get_where_list('({!s} == True)'.
+            format(self.currentatt))
+
+        i = 0
+        n = len(indexes)
+
+        self.__bloom = None
+        if self.bloomfilter is True:
+            self.__bloom = BloomFilter(max(2 * n, 1000000))
+        elif self.bloomfilter:
+            self.__bloom = BloomFilter(self.bloomfilter)
+
+        with Progress(n, verbose=self.verbose) as p:
+            for index in indexes:
+                if self.verbose:
+                    p.update(i)
+                    i += 1
+
+                row = self.connection[index]
+                rowhashvalue = row[self.hashatt]
+                if not self.binaryhash:
+                    rowhashvalue = rowhashvalue.decode()
+                keyhashvalue = self._compute_hash_key(row)
+
+                self.__hashtable[keyhashvalue].append(rowhashvalue)
+                if self.__bloom is not None:
+                    self.__bloom.add(keyhashvalue)
 
     def _getnextid(self):
+        if self.keyallocator:
+            return self.keyallocator.next()
+
         self.__maxid += 1
         return self.__maxid
 
@@ -336,28 +1008,108 @@ class SlowlyChangingDimension(object):
 
     def _compute_hash_row(self, row):
         """Computes hash of the entire row.
-           See hashlib.algorithms_guaranteed for the complete algorithm list.
+           See pyscd.hashing.compute_hash for the hash formats.
         """
-        m = hashlib.sha1()
-
-        for col in self.attributes:
-            value = row[col]
-            if not isinstance(value, bytes):
-                value = str(value).encode()
-            m.update(value)
-
-        return m.hexdigest()
+        return compute_hash(row, self.attributes,
+                            self.binaryhash, self.typedhash)
 
     def _compute_hash_key(self, row):
         """Computes hash of the key fields.
-           See hashlib.algorithms_guaranteed for the complete algorithm list.
+           See pyscd.hashing.compute_hash for the hash formats.
         """
-        m = hashlib.sha1()
+        return compute_hash(row, self.lookupatts,
+                            self.binaryhash, self.typedhash)
+
 
-        for col in self.lookupatts:
-            value = row[col]
-            if not isinstance(value, bytes):
-                value = str(value).encode()
-            m.update(value)
+def _member_keys(rows, atts):
+    """Return two 64 bit hashes of the given columns of each row, as an
+       array of shape (len(rows), 2), computed with vectorized operations
+       over the raw bytes of the columns. Rows with the same values have the
+       same keys.
+    """
+    n = len(rows)
+    keys = np.empty((n, 2), dtype=np.uint64)
+    keys[:, 0] = np.uint64(0xcbf29ce484222325)
+    keys[:, 1] = np.uint64(0x84222325cbf29ce4)
+    primes = np.array([0x100000001b3, 0x9e3779b97f4a7c15], dtype=np.uint64)
+    shift = np.uint64(29)
+
+    for att in atts:
+        raw = np.ascontiguousarray(rows[att]).view(np.uint8).reshape(n, -1)
+        pad = -raw.shape[1] % 8
+        if pad:
+            raw = np.concatenate([raw, np.zeros((n, pad), dtype=np.uint8)],
+                                 axis=1)
+        for word in raw.view('<u8').T:
+            keys ^= word[:, None]
+            keys *= primes
+            keys ^= keys >> shift
+
+    return keys
+
+
+def _to_timestamp(date):
+    """Convert a date, or a date string in the format 'yyyy-MM-dd', to
+       nanoseconds since the epoch, as stored in the from and to columns.
+    """
+    return np.datetime64(date, 'ns').astype(np.int64)
 
-        return m.hexdigest()
+
+def migrate_hashes(table, attributes, hashatt='scd_hash',
+                   binaryhash=True, typedhash=True, chunksize=100000):
+    """Rewrite an existing dimension table with the hash column in another
+       format. The hash column is resized to fit it, so the table is copied
+       in chunks to a new one that then replaces it. Returns the new table.
+
+       The shard tables of a ShardedDimension are migrated one by one. Their
+       members stay in the same shard, as shards do not depend on the hash
+       format.
+
+    Parameters
+    ----------
+
+    table
+        Required. The Tables.Table of the dimension.
+
+    attributes
+        Required. The hashed columns, in the order of the attributes of the
+        SlowlyChangingDimension: lookup, type 1, type 2, type 3 and type 6.
+
+    hashatt, binaryhash, typedhash
+        Optional. Same as in SlowlyChangingDimension. The hash format to
+        migrate to.
+    """
+    h5file = table._v_file
+    parent = table._v_parent
+    name = table._v_name
+
+    columns = dict(table.description._v_colobjects)
+    columns[hashatt] = tb.StringCol(16 if binaryhash else 40,
+                                    pos=columns[hashatt]._v_pos)
+
+    newtable = h5file.create_table(parent, name + '_migrating', columns,
+                                   title=table.title, filters=table.filters,
+                                   expectedrows=table.nrows)
+    table.attrs._f_copy(newtable)
+
+    for start in range(0, table.nrows, chunksize):
+        rows = table.read(start, start + chunksize)
+        newrows = np.empty(len(rows), dtype=newtable.dtype)
+        for col in newrows.dtype.names:
+            if col != hashatt:
+                newrows[col] = rows[col]
+        newrows[hashatt] = [compute_hash(row, attributes,
+                                         binaryhash, typedhash)
+                            for row in rows]
+        newtable.append(newrows)
+    newtable.flush()
+
+    for col, indexed in table.colindexed.items():
+        if indexed:
+            index = table.colinstances[col].index
+            newtable.colinstances[col].create_index(
+                optlevel=index.optlevel, kind=index.kind)
+
+    table.remove()
+    newtable.move(parent, name)
+    return newtable
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import math
+import numbers
+import struct
+
+# Size in bytes of binary digests
+DIGEST_SIZE = 16
+
+
+def encode_legacy(value):
+    """Encode a value as its string representation. Values of different
+       types can have the same encoding, like 1 and b'1'.
+    """
+    if not isinstance(value, bytes):
+        value = str(value).encode()
+    return value
+
+
+def encode_typed(value):
+    """Encode a value canonically by type: a one byte tag followed by a fixed
+       width binary value, or by the length and the bytes of strings.
+       Integers and floats are encoded the same regardless of their width.
+    """
+    if isinstance(value, bytes):
+        return b'b' + struct.pack('<q', len(value)) + value
+    if isinstance(value, str):
+        value = value.encode('utf-8')
+        return b's' + struct.pack('<q', len(value)) + value
+    # numpy booleans are not a numbers.Integral, bool is
+    if isinstance(value, bool) or getattr(value, 'dtype', None) == '?':
+        return b'?' + struct.pack('<?', value)
+    if isinstance(value, numbers.Integral):
+        value = int(value)
+        if -2 ** 63 <= value < 2 ** 63:
+            return b'i' + struct.pack('<q', value)
+        return b'I' + str(value).encode()
+    if isinstance(value, numbers.Real):
+        value = float(value)
+        if math.isnan(value):
+            value = float('nan')
+        elif value == 0.0:
+            value = 0.0
+        return b'f' + struct.pack('<d', value)
+    if value is None:
+        return b'n'
+    return b'r' + str(value).encode()
+
+
+def compute_hash(row, cols, binary=False, typed=False):
+    """Computes hash of the given columns of the row.
+
+       * binary False: SHA-1 hex digest, as a string of 40 characters.
+       * binary True: BLAKE2b digest of DIGEST_SIZE bytes. Trailing null
+         bytes are removed, as HDF5 strings can not keep them.
+    """
+    encode = encode_typed if typed else encode_legacy
+
+    if binary:
+        m = hashlib.blake2b(digest_size=DIGEST_SIZE)
+    else:
+        m = hashlib.sha1()
+
+    for col in cols:
+        m.update(encode(row[col]))
+
+    if binary:
+        return m.digest().rstrip(b'\x00')
+    return m.hexdigest()
+
+
+def hash_to_int(hashvalue):
+    """Return an integer taken from the first 8 bytes of a hash, either hex
+       or binary.
+    """
+    if isinstance(hashvalue, bytes):
+        return int.from_bytes(hashvalue[:8].ljust(8, b'\x00'), 'big')
+    return int(hashvalue[:16], 16)
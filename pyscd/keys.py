@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+try:
+    import fcntl
+except ImportError:     # Windows
+    fcntl = None
+    import msvcrt
+
+
+class KeyAllocator(object):
+    """Hands out surrogate keys from blocks reserved in a persisted sequence.
+
+       The persisted high-water mark is only touched once every 'blocksize'
+       keys, so several loaders can assign keys without coordinating on every
+       row. Keys of a block that is not used up are lost, leaving gaps.
+
+       Subclasses implement _reserve(n), which must advance the high-water
+       mark by n and return the first key of the reserved block, and
+       _advance(key), which must raise the high-water mark to key when it is
+       lower.
+    """
+    def __init__(self, blocksize=1000):
+        if not isinstance(blocksize, int) or blocksize < 1:
+            raise ValueError('Block size must be a positive integer')
+
+        self.blocksize = blocksize
+        self.__next = 1
+        self.__last = 0
+
+    def next(self):
+        """Return the next free key, reserving a new block when needed.
+        """
+        if self.__next > self.__last:
+            self.__next = self._reserve(self.blocksize)
+            self.__last = self.__next + self.blocksize - 1
+
+        key = self.__next
+        self.__next += 1
+        return key
+
+    def advance(self, key):
+        """Make sure the keys handed out from now on are higher than key,
+           like the highest key already in a dimension table.
+        """
+        self._advance(key)
+        if self.__next <= key:
+            self.__next = key + 1
+
+    def _reserve(self, n):
+        raise NotImplementedError
+
+    def _advance(self, key):
+        raise NotImplementedError
+
+
+class TableKeyAllocator(KeyAllocator):
+    """Keeps the high-water mark in an HDF5 attribute of the dimension table.
+
+       When the attribute does not exist yet, it is initialized with the
+       maximum key found in the table, read in chunks, so there is no
+       assumption about the physical order of the rows. When it exists, it
+       is raised to the key of the last row if that one is higher, as
+       dimensions without a key allocator append keys after it without
+       updating it.
+
+       Suited for a single writer per table. Use FileKeySequence when several
+       processes write to the same dimension.
+    """
+    def __init__(self, table, key='scd_id', attr='scd_maxid',
+                 blocksize=1000, chunksize=1000000):
+        super(TableKeyAllocator, self).__init__(blocksize)
+        self.table = table
+        self.attr = attr
+
+        if attr not in table.attrs:
+            maxid = 0
+            for start in range(0, table.nrows, chunksize):
+                keys = table.read(start, start + chunksize, field=key)
+                maxid = max(maxid, int(keys.max()))
+            table.attrs[attr] = maxid
+        elif table.nrows:
+            lastid = int(table.read(table.nrows - 1, field=key)[0])
+            if lastid > table.attrs[attr]:
+                table.attrs[attr] = lastid
+
+    @property
+    def highwatermark(self):
+        return int(self.table.attrs[self.attr])
+
+    def _reserve(self, n):
+        first = self.highwatermark + 1
+        self.table.attrs[self.attr] = first + n - 1
+        return first
+
+    def _advance(self, key):
+        if self.highwatermark < key:
+            self.table.attrs[self.attr] = key
+
+
+class FileKeySequence(KeyAllocator):
+    """Keeps the high-water mark in a small text file guarded by a file lock.
+
+       Any number of processes may share the same sequence file. Each block
+       reservation takes an exclusive lock, reads the mark, advances it and
+       releases the lock. A dimension given the sequence raises the mark to
+       the highest key of its table, so an empty or new file can be used
+       with an existing dimension.
+    """
+    def __init__(self, path, blocksize=1000, start=0):
+        super(FileKeySequence, self).__init__(blocksize)
+        self.path = path
+        self.start = start
+
+    @property
+    def highwatermark(self):
+        with open(self.path, 'a+') as f:
+            with _FileLock(f):
+                return self.__read(f)
+
+    def _reserve(self, n):
+        with open(self.path, 'a+') as f:
+            with _FileLock(f):
+                first = self.__read(f) + 1
+                self.__write(f, first + n - 1)
+        return first
+
+    def _advance(self, key):
+        with open(self.path, 'a+') as f:
+            with _FileLock(f):
+                if self.__read(f) < key:
+                    self.__write(f, key)
+
+    def __read(self, f):
+        f.seek(0)
+        value = f.read().strip()
+        return int(value) if value else self.start
+
+    def __write(self, f, value):
+        f.seek(0)
+        f.truncate()
+        f.write(str(value))
+        f.flush()
+        os.fsync(f.fileno())
+
+
+class _FileLock(object):
+    """Exclusive lock over an open file, released on exit.
+    """
+    def __init__(self, f):
+        self.f = f
+
+    def __enter__(self):
+        if fcntl:
+            fcntl.flock(self.f.fileno(), fcntl.LOCK_EX)
+        else:
+            self.f.seek(0)
+            msvcrt.locking(self.f.fileno(), msvcrt.LK_LOCK, 1)
+        return self
+
+    def __exit__(self, *args):
+        if fcntl:
+            fcntl.flock(self.f.fileno(), fcntl.LOCK_UN)
+        else:
+            self.f.seek(0)
+            msvcrt.locking(self.f.fileno(), msvcrt.LK_UNLCK, 1)
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+
+import time
+from collections import OrderedDict
+
+
+class PhaseStats(object):
+    """Wall and CPU time of all the runs of a phase, with a histogram of the
+       wall time in power of 2 buckets of microseconds.
+    """
+    def __init__(self):
+        self.count = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.max = 0.0
+        self.histogram = {}
+
+    def record(self, wall, cpu):
+        self.count += 1
+        self.wall += wall
+        self.cpu += cpu
+        self.max = max(self.max, wall)
+
+        # Bucket n holds the runs that took less than 2**n microseconds
+        bucket = int(wall * 1e6).bit_length()
+        self.histogram[bucket] = self.histogram.get(bucket, 0) + 1
+
+    def merge(self, other):
+        self.count += other.count
+        self.wall += other.wall
+        self.cpu += other.cpu
+        self.max = max(self.max, other.max)
+        for bucket, count in other.histogram.items():
+            self.histogram[bucket] = self.histogram.get(bucket, 0) + count
+
+    @property
+    def mean(self):
+        return self.wall / self.count if self.count else 0.0
+
+    @property
+    def cpu_ratio(self):
+        """CPU time over wall time. Close to 1 for CPU bound phases and
+           close to 0 for phases waiting on I/O.
+        """
+        return self.cpu / self.wall if self.wall else 0.0
+
+
+class _Phase(object):
+    def __init__(self, stats):
+        self.stats = stats
+
+    def __enter__(self):
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+
+    def __exit__(self, *args):
+        self.stats.record(time.perf_counter() - self.wall,
+                          time.process_time() - self.cpu)
+
+
+class LoadProfile(object):
+    """Timings of the internal phases of a load and the amount of data read
+       from and written to the dimension table.
+
+       Phases: hash, probe, lookup, type1, type2_close, append and flush.
+    """
+    PHASES = ('hash', 'probe', 'lookup', 'type1', 'type2_close',
+              'append', 'flush')
+
+    def __init__(self, rowsize=0):
+        self.rowsize = rowsize
+        self.phases = OrderedDict((name, PhaseStats())
+                                  for name in self.PHASES)
+        self.rows_read = 0
+        self.rows_written = 0
+
+    def phase(self, name):
+        """Return a context manager timing a run of the phase.
+        """
+        return _Phase(self.phases[name])
+
+    def read(self, nrows):
+        self.rows_read += nrows
+
+    def written(self, nrows):
+        self.rows_written += nrows
+
+    def merge(self, other):
+        """Add the timings and counts of another profile, like the one of
+           another shard or worker of the same dimension, to this one.
+        """
+        for name, stats in other.phases.items():
+            self.phases[name].merge(stats)
+        self.rows_read += other.rows_read
+        self.rows_written += other.rows_written
+
+    @property
+    def bytes_read(self):
+        return self.rows_read * self.rowsize
+
+    @property
+    def bytes_written(self):
+        return self.rows_written * self.rowsize
+
+    def report(self):
+        """Return the profile as a text table.
+        """
+        lines = ['{:<12} {:>10} {:>10} {:>10} {:>10} {:>6}'.format(
+            'phase', 'count', 'total s', 'mean us', 'max us', 'cpu %')]
+
+        for name, stats in self.phases.items():
+            lines.append('{:<12} {:>10} {:>10.3f} {:>10.1f} {:>10.1f} '
+                         '{:>6.0f}'.format(name, stats.count, stats.wall,
+                                           stats.mean * 1e6, stats.max * 1e6,
+                                           stats.cpu_ratio * 100))
+
+        lines.append('rows read {}, {} bytes; rows written {}, {} bytes'.
+            format(self.rows_read, self.bytes_read,
+                   self.rows_written, self.bytes_written))
+
+        lines.append('')
+        lines.append(self.histograms())
+
+        return '\n'.join(lines)
+
+    def histograms(self):
+        """Return the wall time histogram of each phase run at least once,
+           as the number of runs under each power of 2 of microseconds.
+        """
+        lines = ['wall time histogram, runs per bucket of microseconds']
+
+        for name, stats in self.phases.items():
+            if stats.count:
+                lines.append('{:<12} {}'.format(name, ' '.join(
+                    '<{}:{}'.format(2 ** bucket, stats.histogram[bucket])
+                    for bucket in sorted(stats.histogram))))
+
+        return '\n'.join(lines)
+
+
+class NullProfile(object):
+    """Stands for a LoadProfile when profiling is off, doing nothing.
+    """
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *args):
+        pass
+
+    def phase(self, name):
+        return self
+
+    def read(self, nrows):
+        pass
+
+    def written(self, nrows):
+        pass
@@ -11,9 +11,12 @@ class Progress(object):
 
        Is printed every completed percent or every 'interval' seconds.
        A full bar, 100%, and the elapsed time is printed at the end.
+       Nothing is printed when verbose is False.
     """
-    def __init__(self, n, interval=0.5, lenght=50, fill='#', empty='.'):
+    def __init__(self, n, interval=0.5, lenght=50, fill='#', empty='.',
+                 verbose=True):
         self.length = n
+        self.verbose = verbose
         self.interval = interval
         self.barlenth = lenght
         self.__fill = fill
@@ -31,11 +34,17 @@ class Progress(object):
         return self
 
     def __exit__(self, *args):
+        if not self.verbose:
+            return
+
         print(' [{}] 100%  {:02}:{:02}:{:02}'.
             format(self.__fill * self.barlenth,
                    *self.divmods(self.elapsed())))
 
     def update(self, i):
+        if not self.verbose:
+            return
+
         percent = 100 * i // self.length
 
         if percent != self.previouspercent or \
@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+from pyscd.dimension import SlowlyChangingDimension
+from pyscd.hashing import compute_hash, hash_to_int
+from pyscd.keys import TableKeyAllocator
+
+
+def shard_hash(row, lookupatts):
+    """Return the hash of the lookup key that places a member in a shard.
+
+       It is always the SHA-1 of the legacy encoding, whatever the binaryhash
+       and typedhash options of the dimension, so changing them or migrating
+       the hashes of the shards with migrate_hashes() does not move members
+       to another shard.
+    """
+    return compute_hash(row, lookupatts)
+
+
+def shard_of(shardhashvalue, nshards):
+    """Return the shard number of a member given its shard_hash().
+    """
+    return hash_to_int(shardhashvalue) % nshards
+
+
+def create_sharded_dimension(h5file, where, name, description, nshards,
+                             filters=None, indexes=()):
+    """Create a group holding one table per shard, named shard0..shardN-1,
+       with an index on each of the given columns. Returns the tables.
+    """
+    group = h5file.create_group(where, name)
+    tables = []
+
+    for i in range(nshards):
+        table = h5file.create_table(group, 'shard{}'.format(i),
+                                    description, filters=filters)
+        for col in indexes:
+            table.colinstances[col].create_index()
+        tables.append(table)
+
+    return tables
+
+
+class ShardedDimension(object):
+    """A slowly changing dimension split into shards by hash of the lookup
+       key, behind the same interface as SlowlyChangingDimension.
+
+       Each shard is a separate table, with its own index and writer, so a
+       load can also be run with one process per shard: open only that
+       shard as a SlowlyChangingDimension and feed it the rows for which
+       shard_of() returns its number. Surrogate keys are unique across shards
+       as long as all of them share the same key allocator.
+
+       Members are placed by shard_hash(), which does not depend on the hash
+       options, so these can change without moving members between shards.
+    """
+
+    def __init__(self, connections, lookupatts, type1atts, type2atts,
+                 keyallocator=None, **kwargs):
+        """
+        Parameters
+        ----------
+
+        connections
+            Required. A list of Tables.Table, one per shard, in shard order.
+            The number of shards is part of the physical layout: it must not
+            change once the dimension holds data.
+
+        keyallocator
+            Optional. The pyscd.keys.KeyAllocator shared by all shards.
+            * None: Uses a TableKeyAllocator on the first shard.
+            Default None.
+
+        All other arguments are passed to each SlowlyChangingDimension.
+        """
+        if not isinstance(connections, (list, tuple)) or not len(connections):
+            raise ValueError('No shard tables given')
+
+        key = kwargs.get('key', 'scd_id')
+        if not keyallocator:
+            keyallocator = TableKeyAllocator(connections[0], key=key)
+
+        self.keyallocator = keyallocator
+        self.shards = [SlowlyChangingDimension(connection,
+                                               lookupatts, type1atts,
+                                               type2atts,
+                                               keyallocator=keyallocator,
+                                               **kwargs)
+                       for connection in connections]
+
+    def __len__(self):
+        return sum(len(shard.connection) for shard in self.shards)
+
+    @property
+    def new_rows(self):
+        return sum(shard.new_rows for shard in self.shards)
+
+    @property
+    def updated_type1_rows(self):
+        return sum(shard.updated_type1_rows for shard in self.shards)
+
+    @property
+    def updated_type2_rows(self):
+        return sum(shard.updated_type2_rows for shard in self.shards)
+
+    @property
+    def updated_type3_rows(self):
+        return sum(shard.updated_type3_rows for shard in self.shards)
+
+    def shard_of(self, row):
+        """Return the shard number the row belongs to.
+        """
+        return shard_of(shard_hash(row, self.shards[0].lookupatts),
+                        len(self.shards))
+
+    def shard(self, row):
+        """Return the SlowlyChangingDimension of the shard the row belongs to.
+        """
+        return self.shards[self.shard_of(row)]
+
+    def lookup(self, tablerow):
+        """Read the newest version of the row.
+        """
+        return self.shard(tablerow).lookup(tablerow)
+
+    def lookup_many(self, tablerows, current=True, blocksize=256):
+        """Read many rows at once, with one batch of queries per shard.
+        """
+        batches = [[] for shard in self.shards]
+        for row in tablerows:
+            batches[self.shard_of(row)].append(
+                {att: row[att] for att in self.shards[0].lookupatts})
+
+        found = {}
+        for shard, rows in zip(self.shards, batches):
+            if rows:
+                found.update(shard.lookup_many(rows, current, blocksize))
+        return found
+
+    def update(self, row):
+        """Update the shard the row belongs to.
+        """
+        self.shard(row).update(row)
+
+    def insert(self, rowdata, version=1):
+        """Insert the given row in the shard it belongs to.
+        """
+        self.shard(rowdata).insert(rowdata, version)
+
+    def apply(self):
+        """Write the change sets of a dry run to all shards. The change set
+           of every shard is checked first, so nothing is written when the
+           table of one of them changed.
+        """
+        if not self.shards[0].dryrun:
+            raise ValueError('There is no change set out of dry run mode')
+
+        for shard in self.shards:
+            shard.changeset.check(shard.connection)
+        for shard in self.shards:
+            shard.apply()
+
+    def to_dataframes(self):
+        """Return the change sets of a dry run of all shards as a dict of
+           pandas DataFrames, like ChangeSet.to_dataframes(), with a first
+           'shard' column, as coordinates refer to the table of the shard.
+        """
+        import pandas as pd
+
+        if not self.shards[0].dryrun:
+            raise ValueError('There is no change set out of dry run mode')
+
+        merged = {}
+        for i, shard in enumerate(self.shards):
+            for name, df in shard.changeset.to_dataframes().items():
+                df.insert(0, 'shard', i)
+                merged.setdefault(name, []).append(df)
+
+        return {name: pd.concat(dfs, ignore_index=True)
+                for name, dfs in merged.items()}
+
+    def compact(self, keep=None, newer_than=None, merge=True):
+        """Compact each shard. Returns a list with the number of rows
+           removed from each shard.
+        """
+        return [shard.compact(keep, newer_than, merge)
+                for shard in self.shards]
+
+    def verify(self, chunksize=1000000, hashes=True):
+        """Verify each shard. Returns a list with the violations of each
+           shard, as coordinates in that shard's table.
+        """
+        return [shard.verify(chunksize, hashes) for shard in self.shards]
+
+    def repair(self, chunksize=1000000, hashes=True):
+        """Repair each shard. Returns a list with the violations fixed in
+           each shard.
+        """
+        return [shard.repair(chunksize, hashes) for shard in self.shards]
+
+    def flush(self):
+        for shard in self.shards:
+            shard.flush()
+
+    def read(self):
+        """Read the rows of all shards into a single array.
+        """
+        return np.concatenate([shard.connection.read()
+                               for shard in self.shards])
+
+    def iterrows(self):
+        """Iterate over the rows of all shards, one shard after the other.
+        """
+        for shard in self.shards:
+            for row in shard.connection.iterrows():
+                yield row
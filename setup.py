@@ -16,10 +16,13 @@ setup(
         'Operating System :: OS Independent',
         'Programming Language :: Python',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.4',
-        'Programming Language :: Python :: 3.5',
+        'Programming Language :: Python :: 3.7',
         'Topic :: Software Development :: Libraries :: Python Modules',
     ],
     packages=['pyscd'],
+    python_requires='>=3.7',
     install_requires=['numpy', 'tables'],
+    entry_points={
+        'console_scripts': ['pyscd = pyscd.cli:main'],
+    },
 )
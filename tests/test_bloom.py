@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import hashlib
+from pyscd.bloom import BloomFilter
+
+
+def digest(i):
+    return hashlib.sha1(str(i).encode()).hexdigest()
+
+
+class TestBloomFilter(unittest.TestCase):
+    def test_no_false_negatives(self):
+        bloom = BloomFilter(1000)
+        for i in range(1000):
+            bloom.add(digest(i))
+
+        self.assertEqual(len(bloom), 1000)
+        self.assertTrue(all(digest(i) in bloom for i in range(1000)))
+
+    def test_false_positive_rate(self):
+        bloom = BloomFilter(1000, error_rate=0.01)
+        for i in range(1000):
+            bloom.add(digest(i))
+
+        positives = sum(digest(i) in bloom for i in range(1000, 11000))
+        self.assertLess(positives, 300)
+
+    def test_binary_digests(self):
+        bloom = BloomFilter(10)
+        bloom.add(b'\x01\x02\x03')
+
+        self.assertIn(b'\x01\x02\x03', bloom)
+        self.assertNotIn(b'\x04\x05\x06', bloom)
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import os
+import tables as tb
+from pyscd.dimension import SlowlyChangingDimension as scd
+from tests.test_dimension import create_dimension_orders, \
+    create_dimension_workcenters, import_orders
+
+
+class TestChangeSet(unittest.TestCase):
+    def setUp(self):
+        self.filename = 'test_changeset.h5'
+
+        if os.path.isfile(self.filename):
+            os.remove(self.filename)
+
+        self.h5file = tb.open_file(self.filename, mode='a')
+        create_dimension_orders(self.h5file)
+        self.h5file.close()
+
+        import_orders(self.filename, 'tests/data/add 1 row.csv')
+        self.h5file = tb.open_file(self.filename, mode='a')
+        self.load()
+        self.h5file.close()
+
+        import_orders(self.filename, 'tests/data/modify 1 row.csv')
+        self.h5file = tb.open_file(self.filename, mode='a')
+
+    def tearDown(self):
+        self.h5file.close()
+        if os.path.isfile(self.filename):
+            os.remove(self.filename)
+
+    def load(self, **kwargs):
+        h5table = self.h5file.root.orders.table
+        h5dim = self.h5file.root.dimorders.table
+
+        dim = scd(connection=h5dim,
+                  lookupatts=['order', 'line'],
+                  type1atts=['currency'],
+                  type2atts=['status'],
+                  asof='2015-10-23',
+                  **kwargs)
+
+        for row in h5table.iterrows():
+            dim.update(row)
+        h5dim.flush()
+
+        return dim
+
+    def test_dry_run_does_not_touch_table(self):
+        h5dim = self.h5file.root.dimorders.table
+        before = h5dim.read()
+
+        dim = self.load(dryrun=True)
+        changes = dim.changeset.to_dataframes()
+
+        self.assertEqual(dim.updated_type2_rows, 1)
+        self.assertEqual(len(changes['new']), 0)
+        self.assertEqual(len(changes['type1']), 0)
+        self.assertEqual(list(changes['type2_close']['coordinate']), [0])
+        self.assertEqual(list(changes['type2_open']['status']),
+                         [b'Completed'])
+        self.assertEqual(h5dim.read().tolist(), before.tolist())
+
+    def test_apply_gives_same_table_as_update(self):
+        dim = self.load(dryrun=True)
+        dim.apply()
+        applied = self.h5file.root.dimorders.table.read()
+        self.h5file.close()
+
+        # Load the same data again in a fresh file, without dry run
+        self.setUp()
+        self.load()
+        updated = self.h5file.root.dimorders.table.read()
+
+        self.assertEqual(applied.tolist(), updated.tolist())
+        self.assertEqual(len(updated), 3)
+
+    def test_repeated_members_see_staged_changes(self):
+        h5dim = self.h5file.root.dimorders.table
+        dim = scd(connection=h5dim,
+                  lookupatts=['order', 'line'],
+                  type1atts=['currency'],
+                  type2atts=['status'],
+                  asof='2015-10-23',
+                  dryrun=True)
+
+        dim.update({'order': b'1', 'line': 10,
+                    'status': b'Delivered', 'currency': b'USD'})
+        dim.update({'order': b'1', 'line': 10,
+                    'status': b'Delivered', 'currency': b'EUR'})
+        changes = dim.changeset.to_dataframes()
+
+        self.assertEqual(dim.updated_type2_rows, 1)
+        self.assertEqual(dim.updated_type1_rows, 1)
+        self.assertEqual(list(changes['type1']['changed']), [['currency']])
+        self.assertEqual(list(changes['type2_open']['currency']), [b'EUR'])
+
+        dim.apply()
+        self.assertEqual(list(h5dim.col('currency')),
+                         [b'EUR', b'USD', b'EUR'])
+        self.assertEqual(list(h5dim.col('scd_current')),
+                         [False, True, True])
+
+    def test_apply_refuses_changed_rows(self):
+        h5dim = self.h5file.root.dimorders.table
+        dim = self.load(dryrun=True)
+
+        self.assertRaises(ValueError, dim.compact)
+
+        # Same number of rows, but the patched row was rewritten in place
+        rows = h5dim.read()
+        h5dim.modify_rows(0, 2, rows=rows[::-1])
+        h5dim.flush()
+
+        self.assertRaises(ValueError, dim.apply)
+        self.assertEqual(h5dim.read().tolist(), rows[::-1].tolist())
+
+    def test_nan_values_are_unchanged(self):
+        create_dimension_workcenters(self.h5file)
+        h5dim = self.h5file.root.dimworkcenters.table
+
+        def load(row, **kwargs):
+            dim = scd(connection=h5dim,
+                      lookupatts=['workcenter'],
+                      type1atts=['description', 'hours'],
+                      type2atts=['group'],
+                      asof='2015-10-23',
+                      **kwargs)
+            dim.update(row)
+            return dim
+
+        row = {'workcenter': b'W1', 'description': b'Old', 'group': b'G',
+               'hours': float('nan')}
+        load(row).flush()
+
+        row['description'] = b'New'
+        dim = load(row, dryrun=True)
+        changes = dim.changeset.to_dataframes()
+
+        self.assertEqual(list(changes['type1']['changed']), [['description']])
+
+        dim.apply()
+        self.assertEqual(list(h5dim.col('description')), [b'New'])
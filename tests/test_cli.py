@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import contextlib
+import io
+import os
+import tables as tb
+from pyscd.cli import main
+from tests.test_dimension import DimensionOrders, create_dimension_orders
+
+
+class TestCommandLine(unittest.TestCase):
+    def setUp(self):
+        self.filenames = ['test_cli.h5', 'test_cli0.h5', 'test_cli1.h5',
+                          'test_cli.seq']
+        self.tearDown()
+
+    def tearDown(self):
+        for filename in self.filenames:
+            if os.path.isfile(filename):
+                os.remove(filename)
+
+    def load(self, *args):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            status = main(['load'] + list(args) +
+                          ['--lookup', 'order,line',
+                           '--type2', 'status,currency',
+                           '--asof', '2015-10-23'])
+
+        self.assertEqual(status, 0)
+        return output.getvalue()
+
+    def test_load_csv(self):
+        with tb.open_file('test_cli.h5', mode='a') as h5file:
+            create_dimension_orders(h5file)
+
+        self.load('tests/data/add 1 row.csv', 'test_cli.h5:/dimorders/table')
+        output = self.load('tests/data/modify 1 row.csv',
+                           'test_cli.h5:/dimorders/table', '--chunksize', '1')
+
+        self.assertIn('type 2               1', output)
+        self.assertIn('type2_close', output)
+
+        with tb.open_file('test_cli.h5') as h5file:
+            h5dim = h5file.root.dimorders.table
+            self.assertEqual(list(h5dim.col('order')), [b'00001'] * 3)
+            self.assertEqual(list(h5dim.col('scd_id')), [1, 2, 3])
+            self.assertEqual(list(h5dim.col('scd_current')),
+                             [False, True, True])
+
+    def test_load_shard_files_with_workers(self):
+        for i in range(2):
+            with tb.open_file('test_cli{}.h5'.format(i), mode='a') as h5file:
+                h5file.create_table('/', 'dimorders', DimensionOrders)
+
+        output = self.load('tests/data/add 1 row.csv',
+                           'test_cli{shard}.h5:/dimorders',
+                           '--shards', '2', '--workers', '2',
+                           '--key-sequence', 'test_cli.seq')
+
+        self.assertIn('new                  2', output)
+
+        keys = []
+        for i in range(2):
+            with tb.open_file('test_cli{}.h5'.format(i)) as h5file:
+                keys += list(h5file.root.dimorders.col('scd_id'))
+        self.assertEqual(len(set(keys)), 2)
+
+    def test_dimension_without_node(self):
+        with contextlib.redirect_stderr(io.StringIO()) as error:
+            with self.assertRaises(SystemExit):
+                self.load('tests/data/add 1 row.csv', 'test_cli.h5')
+
+        self.assertIn('node of its table', error.getvalue())
@@ -20,6 +20,21 @@ class DimensionOrders(tb.IsDescription):
     scd_hash        = tb.StringCol(40, pos=9)
 
 
+class DimensionOrdersHistory(tb.IsDescription):
+    order                  = tb.StringCol(255, pos=0)
+    line                   = tb.Int64Col(pos=1)
+    status                 = tb.StringCol(255, pos=2)
+    previous_status        = tb.StringCol(255, pos=3)
+    currency               = tb.StringCol(255, pos=4)
+    current_currency       = tb.StringCol(255, pos=5)
+    scd_id                 = tb.Int64Col(pos=6)
+    scd_valid_from         = tb.Int64Col(pos=7)
+    scd_valid_to           = tb.Int64Col(pos=8)
+    scd_version            = tb.Int16Col(pos=9)
+    scd_current            = tb.BoolCol(pos=10)
+    scd_hash               = tb.StringCol(40, pos=11)
+
+
 class DimensionWorkCenters(tb.IsDescription):
     workcenter             = tb.StringCol(255, pos=0)
     description            = tb.StringCol(255, pos=1)
@@ -59,7 +74,7 @@ def import_orders(outfilename, infilename):
 
 
 def import_workcenters(outfilename, workbook, worksheet):
-    df = pd.read_excel(workbook, sheetname=worksheet, encoding='latin-1')
+    df = pd.read_excel(workbook, sheet_name=worksheet)
     df.columns = ['workcenter', 'description', 'group', 'hours']
 
     store = pd.HDFStore(outfilename, 'a')
@@ -460,3 +475,380 @@ class TestDimension(unittest.TestCase):
         self.assertEqual(dim.updated_type2_rows, 0)
 
         self.h5file.close()
+
+    def test_compact_merges_and_keeps_versions(self):
+        self.h5file = tb.open_file(self.filename, mode='a')
+        h5dim = self.h5file.root.dimorders.table
+
+        # Five versions of one member, the 3rd and 4th with the same status,
+        # written out of key order
+        h5dim.append([
+            (b'1', 10, b'A', b'USD', 1, 0, 10, 1, False, b''),
+            (b'1', 10, b'C', b'USD', 5, 30, 40, 3, False, b''),
+            (b'1', 10, b'C', b'USD', 6, 40, 50, 4, False, b''),
+            (b'1', 10, b'B', b'USD', 3, 10, 30, 2, False, b''),
+            (b'1', 10, b'D', b'USD', 7, 50, 7258032000000000000, 5, True,
+             b''),
+            (b'2', 10, b'A', b'USD', 2, 0, 7258032000000000000, 1, True,
+             b''),
+        ])
+        h5dim.flush()
+
+        dim = scd(connection=h5dim,
+                  lookupatts=['order', 'line'],
+                  type1atts=[],
+                  type2atts=['status', 'currency'],
+                  asof='2015-10-23')
+
+        removed = dim.compact(keep=3)
+
+        self.assertEqual(removed, 2)
+        self.assertEqual(list(h5dim.col('scd_id')), [3, 5, 7, 2])
+        self.assertEqual(list(h5dim.col('scd_valid_to'))[:2], [30, 50])
+        self.assertEqual(h5dim.attrs.scd_maxid, 7)
+
+        # Rows not flushed yet are compacted too
+        dim.update({'order': b'0', 'line': 10,
+                    'status': b'A', 'currency': b'USD'})
+        dim.compact()
+
+        self.assertEqual(list(h5dim.col('scd_id')), [8, 3, 5, 7, 2])
+
+        self.h5file.close()
+
+    def test_type3_and_type6_attributes(self):
+        self.h5file = tb.open_file(self.filename, mode='a')
+        h5dim = self.h5file.create_table('/', 'dimordershistory',
+                                         DimensionOrdersHistory)
+
+        dim = scd(connection=h5dim,
+                  lookupatts=['order', 'line'],
+                  type1atts=[],
+                  type2atts=[],
+                  type3atts={'status': 'previous_status'},
+                  type6atts={'currency': 'current_currency'},
+                  asof='2015-10-23')
+
+        rows = [{'order': b'1', 'line': 10,
+                 'status': b'Not Delivered', 'currency': b'USD'},
+                {'order': b'1', 'line': 10,
+                 'status': b'Completed', 'currency': b'USD'},
+                {'order': b'1', 'line': 10,
+                 'status': b'Completed', 'currency': b'EUR'}]
+
+        for row in rows:
+            dim.update(row)
+            h5dim.flush()
+
+        self.assertEqual(dim.new_rows, 1)
+        self.assertEqual(dim.updated_type3_rows, 1)
+        self.assertEqual(dim.updated_type2_rows, 1)
+
+        self.assertEqual(len(h5dim), 2)
+        self.assertEqual(list(h5dim.col('currency')), [b'USD', b'EUR'])
+        self.assertEqual(list(h5dim.col('current_currency')),
+                         [b'EUR', b'EUR'])
+        self.assertEqual(list(h5dim.col('status')),
+                         [b'Completed', b'Completed'])
+        self.assertEqual(list(h5dim.col('previous_status')),
+                         [b'Not Delivered', b'Not Delivered'])
+        self.assertEqual(list(h5dim.col('scd_current')), [False, True])
+
+        self.h5file.close()
+
+    def test_bloom_filter_gives_same_results(self):
+        import_orders(self.filename, 'tests/data/add 1 row.csv')
+
+        self.h5file = tb.open_file(self.filename, mode='a')
+        h5table = self.h5file.root.orders.table
+        h5dim = self.h5file.root.dimorders.table
+
+        for i in range(2):
+            dim = scd(connection=h5dim,
+                      lookupatts=['order', 'line'],
+                      type1atts=[],
+                      type2atts=['status', 'currency'],
+                      asof='2015-10-23',
+                      bloomfilter=True)
+
+            for row in h5table.iterrows():
+                dim.update(row)
+            h5dim.flush()
+
+        self.assertEqual(dim.new_rows, 0)
+        self.assertEqual(dim.updated_type2_rows, 0)
+        self.assertEqual(len(h5dim), 2)
+
+        self.h5file.close()
+
+    def test_profile_counts_phases(self):
+        import_orders(self.filename, 'tests/data/add 1 row.csv')
+
+        self.h5file = tb.open_file(self.filename, mode='a')
+        h5table = self.h5file.root.orders.table
+        h5dim = self.h5file.root.dimorders.table
+
+        dim = scd(connection=h5dim,
+                  lookupatts=['order', 'line'],
+                  type1atts=[],
+                  type2atts=['status', 'currency'],
+                  asof='2015-10-23')
+
+        for row in h5table.iterrows():
+            dim.update(row)
+        h5dim.flush()
+        self.h5file.close()
+
+        import_orders(self.filename, 'tests/data/modify 1 row.csv')
+
+        self.h5file = tb.open_file(self.filename, mode='a')
+        h5table = self.h5file.root.orders.table
+        h5dim = self.h5file.root.dimorders.table
+
+        dim = scd(connection=h5dim,
+                  lookupatts=['order', 'line'],
+                  type1atts=[],
+                  type2atts=['status', 'currency'],
+                  asof='2015-10-23',
+                  profile=True)
+
+        for row in h5table.iterrows():
+            dim.update(row)
+        dim.flush()
+
+        phases = dim.profile.phases
+        self.assertEqual(phases['hash'].count, 4)
+        self.assertEqual(phases['probe'].count, 4)
+        self.assertEqual(phases['lookup'].count, 1)
+        self.assertEqual(phases['type2_close'].count, 1)
+        self.assertEqual(phases['append'].count, 1)
+        self.assertEqual(phases['flush'].count, 1)
+        self.assertEqual(dim.profile.rows_written, 2)
+        self.assertEqual(dim.profile.bytes_written, 2 * h5dim.rowsize)
+        self.assertIn('type2_close', dim.profile.report())
+        histogram = dim.profile.phases['lookup'].histogram
+        self.assertEqual(sum(histogram.values()), 1)
+        self.assertIn('lookup       <{}:1'.format(2 ** max(histogram)),
+                      dim.profile.report())
+
+        self.h5file.close()
+
+    def test_flush_only_for_pending_members(self):
+        self.h5file = tb.open_file(self.filename, mode='a')
+        h5dim = self.h5file.root.dimorders.table
+
+        dim = scd(connection=h5dim,
+                  lookupatts=['order', 'line'],
+                  type1atts=['currency'],
+                  type2atts=['status'],
+                  asof='2015-10-23')
+
+        for order in (b'1', b'2'):
+            dim.update({'order': order, 'line': 10,
+                        'status': b'A', 'currency': b'USD'})
+        dim.flush()
+
+        dim = scd(connection=h5dim,
+                  lookupatts=['order', 'line'],
+                  type1atts=['currency'],
+                  type2atts=['status'],
+                  asof='2015-10-24',
+                  profile=True)
+
+        # Changed existing members between new ones do not need a flush
+        dim.update({'order': b'3', 'line': 10,
+                    'status': b'A', 'currency': b'USD'})
+        dim.update({'order': b'1', 'line': 10,
+                    'status': b'B', 'currency': b'USD'})
+        dim.update({'order': b'4', 'line': 10,
+                    'status': b'A', 'currency': b'USD'})
+        dim.update({'order': b'2', 'line': 10,
+                    'status': b'A', 'currency': b'EUR'})
+        self.assertEqual(dim.profile.phases['flush'].count, 0)
+
+        # A member appended since the last flush does
+        dim.update({'order': b'3', 'line': 10,
+                    'status': b'A', 'currency': b'EUR'})
+        self.assertEqual(dim.profile.phases['flush'].count, 1)
+        dim.flush()
+
+        self.assertEqual(list(h5dim.col('scd_id')), [1, 2, 3, 4, 5])
+        self.assertEqual(list(h5dim.col('currency')),
+                         [b'USD', b'EUR', b'EUR', b'USD', b'USD'])
+        self.assertEqual(list(h5dim.col('scd_current')),
+                         [False, True, True, True, True])
+        self.assertTrue(all(len(v) == 0 for v in dim.verify().values()))
+
+        self.h5file.close()
+
+    def test_type1_update_of_long_history(self):
+        self.h5file = tb.open_file(self.filename, mode='a')
+        h5dim = self.h5file.root.dimorders.table
+
+        dim = scd(connection=h5dim,
+                  lookupatts=['order', 'line'],
+                  type1atts=['currency'],
+                  type2atts=['status'],
+                  asof='2015-10-23')
+
+        # 40 versions of a member, each followed by another member, so they
+        # form more runs of rows than MAX_MODIFY_RUNS
+        rows = []
+        for i in range(40):
+            rows.append((b'1', 10, str(i).encode(), b'USD', 2 * i + 1,
+                         i, i + 1, i + 1, i == 39, b''))
+            rows.append((str(i + 2).encode(), 10, b'A', b'USD', 2 * i + 2,
+                         0, 7258032000000000000, 1, True, b''))
+        h5dim.append(rows)
+        h5dim.modify_column(78, 79, column=[7258032000000000000],
+                            colname='scd_valid_to')
+        h5dim.modify_column(column=[dim._compute_hash_row(row)
+                                    for row in h5dim.read()],
+                            colname='scd_hash')
+        h5dim.flush()
+
+        dim = scd(connection=h5dim,
+                  lookupatts=['order', 'line'],
+                  type1atts=['currency'],
+                  type2atts=['status'],
+                  asof='2015-10-23')
+
+        # A new member pending to be flushed, then type 1 changes of
+        # members with one and with many runs of rows
+        dim.update({'order': b'0', 'line': 10,
+                    'status': b'A', 'currency': b'USD'})
+        dim.update({'order': b'2', 'line': 10,
+                    'status': b'A', 'currency': b'CHF'})
+        dim.update({'order': b'1', 'line': 10,
+                    'status': b'39', 'currency': b'EUR'})
+        dim.flush()
+
+        currency = h5dim.col('currency')
+        self.assertEqual(len(h5dim), 81)
+        self.assertEqual(h5dim[80]['order'], b'0')
+        self.assertEqual(h5dim[80]['currency'], b'USD')
+        self.assertEqual(currency[1], b'CHF')
+        self.assertTrue(all(currency[0:80:2] == b'EUR'))
+        self.assertTrue(all(len(v) == 0 for v in dim.verify().values()))
+
+        self.h5file.close()
+
+    def test_lookup_many(self):
+        import_orders(self.filename, 'tests/data/add 1 row.csv')
+
+        self.h5file = tb.open_file(self.filename, mode='a')
+        h5table = self.h5file.root.orders.table
+        h5dim = self.h5file.root.dimorders.table
+
+        dim = scd(connection=h5dim,
+                  lookupatts=['order', 'line'],
+                  type1atts=[],
+                  type2atts=['status', 'currency'],
+                  asof='2015-10-23')
+
+        for row in h5table.iterrows():
+            dim.update(row)
+        h5dim.flush()
+        self.h5file.close()
+
+        import_orders(self.filename, 'tests/data/modify 1 row.csv')
+
+        self.h5file = tb.open_file(self.filename, mode='a')
+        h5table = self.h5file.root.orders.table
+        h5dim = self.h5file.root.dimorders.table
+
+        dim = scd(connection=h5dim,
+                  lookupatts=['order', 'line'],
+                  type1atts=[],
+                  type2atts=['status', 'currency'],
+                  asof='2015-10-23')
+
+        for row in h5table.iterrows():
+            dim.update(row)
+        h5dim.flush()
+
+        rows = [{'order': b'1', 'line': 10},
+                {'order': b'1', 'line': 20},
+                {'order': b'1', 'line': 30},
+                {'order': b'2', 'line': 10}]
+
+        current = dim.lookup_many(rows, blocksize=1)
+        history = dim.lookup_many(rows, current=False)
+
+        self.assertEqual(len(current), 2)
+        self.assertEqual(sorted(len(v) for v in current.values()), [1, 1])
+        self.assertEqual(sorted(len(v) for v in history.values()), [1, 2])
+
+        for row in rows[:2]:
+            found = current[dim._compute_hash_key(row)]
+            self.assertEqual(found[0]['scd_id'], dim.lookup(row)[0]['scd_id'])
+
+        # A new member is found without flushing the table first
+        row = {'order': b'3', 'line': 10,
+               'status': b'Completed', 'currency': b'USD'}
+        dim.update(row)
+        found = dim.lookup_many([{'order': b'3', 'line': 10}])
+
+        self.assertEqual(list(found), [dim._compute_hash_key(row)])
+
+        self.h5file.close()
+
+    def test_verify_and_repair(self):
+        import_orders(self.filename, 'tests/data/add 1 row.csv')
+
+        self.h5file = tb.open_file(self.filename, mode='a')
+        h5table = self.h5file.root.orders.table
+        h5dim = self.h5file.root.dimorders.table
+
+        dim = scd(connection=h5dim,
+                  lookupatts=['order', 'line'],
+                  type1atts=[],
+                  type2atts=['status', 'currency'],
+                  asof='2015-10-23')
+
+        for row in h5table.iterrows():
+            dim.update(row)
+        h5dim.flush()
+
+        asof = h5dim[0]['scd_valid_from']
+        maxto = h5dim[0]['scd_valid_to']
+        h5hash = h5dim[0]['scd_hash']
+
+        # Line 10: a second current version, with a gap before it and a
+        # stale hash. Line 20: a second version overlapping the first one,
+        # but none of them current.
+        h5dim.append([
+            (b'1', 10, b'Completed', b'USD', 3, asof + 2, maxto, 2, True,
+             h5hash),
+            (b'1', 20, b'Cancelled', b'USD', 4, asof + 1, maxto, 2, False,
+             dim._compute_hash_row({'order': b'1', 'line': 20,
+                                    'status': b'Cancelled',
+                                    'currency': b'USD'})),
+        ])
+        h5dim.modify_column(0, 1, column=[asof + 1], colname='scd_valid_to')
+        h5dim.modify_column(1, 2, column=[False], colname='scd_current')
+        h5dim.flush()
+
+        violations = dim.verify(chunksize=2)
+
+        self.assertEqual(list(violations['stale_hash']), [2])
+        self.assertEqual(list(violations['multiple_current']), [0])
+        self.assertEqual(list(violations['no_current']), [3])
+        self.assertEqual(list(violations['gap']), [0])
+        self.assertEqual(list(violations['overlap']), [1])
+
+        # Structural checks only, with a partition per row
+        structural = dim.verify(chunksize=1, hashes=False)
+        self.assertEqual(len(structural['stale_hash']), 0)
+        for name in ('multiple_current', 'no_current', 'gap', 'overlap'):
+            self.assertEqual(list(structural[name]), list(violations[name]))
+
+        dim.repair(chunksize=2)
+
+        self.assertEqual(list(h5dim.col('scd_current')),
+                         [False, False, True, True])
+        self.assertEqual(list(h5dim.col('scd_valid_to')),
+                         [asof + 2, asof + 1, maxto, maxto])
+        self.assertTrue(all(len(v) == 0 for v in dim.verify().values()))
+
+        self.h5file.close()
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import os
+import numpy as np
+import tables as tb
+from pyscd.hashing import compute_hash, encode_typed
+from pyscd.dimension import SlowlyChangingDimension as scd, migrate_hashes
+from tests.test_dimension import create_dimension_orders, import_orders
+
+
+class TestHashing(unittest.TestCase):
+    def test_typed_encoding_does_not_collide(self):
+        self.assertNotEqual(encode_typed(1), encode_typed(b'1'))
+        self.assertNotEqual(encode_typed(1), encode_typed('1'))
+        self.assertNotEqual(encode_typed(1), encode_typed(1.0))
+
+    def test_typed_encoding_ignores_width(self):
+        self.assertEqual(encode_typed(np.int16(7)), encode_typed(7))
+        self.assertEqual(encode_typed(np.float32(0.5)), encode_typed(0.5))
+        self.assertEqual(encode_typed(np.bool_(True)), encode_typed(True))
+
+    def test_binary_hash(self):
+        row = {'order': b'1', 'line': 10}
+        hashvalue = compute_hash(row, ['order', 'line'], binary=True)
+
+        self.assertIsInstance(hashvalue, bytes)
+        self.assertLessEqual(len(hashvalue), 16)
+        self.assertEqual(len(compute_hash(row, ['order', 'line'])), 40)
+
+
+class TestMigrateHashes(unittest.TestCase):
+    def setUp(self):
+        self.filename = 'test_hashing.h5'
+
+        if os.path.isfile(self.filename):
+            os.remove(self.filename)
+
+        self.h5file = tb.open_file(self.filename, mode='a')
+        create_dimension_orders(self.h5file)
+        self.h5file.close()
+
+    def tearDown(self):
+        self.h5file.close()
+        if os.path.isfile(self.filename):
+            os.remove(self.filename)
+
+    def load(self, **kwargs):
+        self.h5file = tb.open_file(self.filename, mode='a')
+        h5table = self.h5file.root.orders.table
+        h5dim = self.h5file.root.dimorders.table
+
+        dim = scd(connection=h5dim,
+                  lookupatts=['order', 'line'],
+                  type1atts=[],
+                  type2atts=['status', 'currency'],
+                  asof='2015-10-23',
+                  **kwargs)
+
+        for row in h5table.iterrows():
+            dim.update(row)
+        h5dim.flush()
+
+        return dim
+
+    def test_migrated_table_is_up_to_date(self):
+        import_orders(self.filename, 'tests/data/add 1 row.csv')
+        dim = self.load()
+
+        h5dim = migrate_hashes(dim.connection, dim.attributes)
+
+        self.assertEqual(h5dim.coldtypes['scd_hash'].itemsize, 16)
+        self.assertTrue(h5dim.cols.order.is_indexed)
+        self.assertEqual(list(h5dim.col('scd_id')), [1, 2])
+        self.h5file.close()
+
+        dim = self.load(binaryhash=True, typedhash=True)
+
+        self.assertEqual(dim.new_rows, 0)
+        self.assertEqual(dim.updated_type2_rows, 0)
+        self.h5file.close()
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import os
+import tables as tb
+from pyscd.keys import TableKeyAllocator, FileKeySequence
+from pyscd.dimension import SlowlyChangingDimension as scd
+from tests.test_dimension import create_dimension_orders, import_orders
+
+
+class TestKeys(unittest.TestCase):
+    def setUp(self):
+        self.filename = 'test_keys.h5'
+        self.sequence = 'test_keys.seq'
+
+        for filename in (self.filename, self.sequence):
+            if os.path.isfile(filename):
+                os.remove(filename)
+
+        self.h5file = tb.open_file(self.filename, mode='a')
+        create_dimension_orders(self.h5file)
+
+    def tearDown(self):
+        self.h5file.close()
+        for filename in (self.filename, self.sequence):
+            if os.path.isfile(filename):
+                os.remove(filename)
+
+    def test_file_sequence_hands_out_disjoint_blocks(self):
+        a = FileKeySequence(self.sequence, blocksize=10)
+        b = FileKeySequence(self.sequence, blocksize=10)
+
+        keysa = [a.next() for i in range(10)]
+        keysb = [b.next() for i in range(5)]
+        keysa += [a.next() for i in range(5)]
+
+        self.assertEqual(keysa, list(range(1, 11)) + list(range(21, 26)))
+        self.assertEqual(keysb, list(range(11, 16)))
+        self.assertEqual(a.highwatermark, 30)
+
+    def test_table_allocator_starts_after_max_key(self):
+        h5dim = self.h5file.root.dimorders.table
+        h5dim.append([(b'1', 10, b'', b'', 7, 0, 0, 1, True, b''),
+                      (b'2', 10, b'', b'', 3, 0, 0, 1, True, b'')])
+
+        allocator = TableKeyAllocator(h5dim, blocksize=5)
+
+        self.assertEqual(allocator.next(), 8)
+        self.assertEqual(h5dim.attrs.scd_maxid, 12)
+
+        # A second allocator continues from the persisted mark
+        self.assertEqual(TableKeyAllocator(h5dim, blocksize=5).next(), 13)
+
+    def test_table_allocator_after_compact_and_plain_load(self):
+        self.h5file.close()
+        import_orders(self.filename, 'tests/data/add 1 row.csv')
+        self.h5file = tb.open_file(self.filename, mode='a')
+        h5table = self.h5file.root.orders.table
+        h5dim = self.h5file.root.dimorders.table
+        h5dim.append([(b'5', 10, b'', b'', 1, 0, 0, 1, True, b''),
+                      (b'3', 10, b'', b'', 3, 0, 0, 1, True, b'')])
+        h5dim.flush()
+
+        def open_dimension():
+            return scd(connection=h5dim,
+                       lookupatts=['order', 'line'],
+                       type1atts=[],
+                       type2atts=['status', 'currency'],
+                       asof='2015-10-23')
+
+        open_dimension().compact()
+        self.assertEqual(h5dim.attrs.scd_maxid, 3)
+
+        # Keys without an allocator continue after the saved mark
+        dim = open_dimension()
+        for row in h5table.iterrows():
+            dim.update(row)
+        h5dim.flush()
+        self.assertEqual(list(h5dim.col('scd_id')), [3, 1, 4, 5])
+
+        self.assertEqual(TableKeyAllocator(h5dim, blocksize=5).next(), 6)
+
+    def test_file_sequence_starts_after_table_keys(self):
+        h5dim = self.h5file.root.dimorders.table
+        h5dim.append([(b'1', 10, b'', b'', 1, 0, 0, 1, True, b''),
+                      (b'2', 10, b'', b'', 3, 0, 0, 1, True, b'')])
+        h5dim.flush()
+
+        sequence = FileKeySequence(self.sequence, blocksize=10)
+        dim = scd(connection=h5dim,
+                  lookupatts=['order', 'line'],
+                  type1atts=[],
+                  type2atts=['status', 'currency'],
+                  asof='2015-10-23',
+                  keyallocator=sequence)
+        dim.update({'order': b'3', 'line': 10,
+                    'status': b'', 'currency': b''})
+        h5dim.flush()
+
+        self.assertEqual(list(h5dim.col('scd_id')), [1, 3, 4])
+        self.assertEqual(sequence.highwatermark, 13)
+
+        # A mark already past the table keys is kept
+        sequence.advance(2)
+        self.assertEqual(sequence.next(), 5)
+        self.assertEqual(sequence.highwatermark, 13)
+
+    def test_dimension_uses_key_allocator(self):
+        self.h5file.close()
+        import_orders(self.filename, 'tests/data/add 1 row.csv')
+        self.h5file = tb.open_file(self.filename, mode='a')
+        h5table = self.h5file.root.orders.table
+        h5dim = self.h5file.root.dimorders.table
+
+        sequence = FileKeySequence(self.sequence, blocksize=10, start=100)
+        dim = scd(connection=h5dim,
+                  lookupatts=['order', 'line'],
+                  type1atts=[],
+                  type2atts=['status', 'currency'],
+                  asof='2015-10-23',
+                  keyallocator=sequence)
+
+        for row in h5table.iterrows():
+            dim.update(row)
+        h5dim.flush()
+
+        self.assertEqual(list(h5dim.col('scd_id')), [101, 102])
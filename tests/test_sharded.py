@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import os
+import tables as tb
+from pyscd.dimension import migrate_hashes
+from pyscd.sharded import ShardedDimension, create_sharded_dimension
+from tests.test_dimension import DimensionOrders, import_orders
+
+
+class TestShardedDimension(unittest.TestCase):
+    def setUp(self):
+        self.filename = 'test_sharded.h5'
+
+        if os.path.isfile(self.filename):
+            os.remove(self.filename)
+
+        self.h5file = tb.open_file(self.filename, mode='a')
+        create_sharded_dimension(self.h5file, '/', 'dimorders',
+                                 DimensionOrders, 4, indexes=['order'])
+        self.h5file.close()
+
+    def tearDown(self):
+        self.h5file.close()
+        if os.path.isfile(self.filename):
+            os.remove(self.filename)
+
+    def open_dimension(self, **kwargs):
+        self.h5file = tb.open_file(self.filename, mode='a')
+        group = self.h5file.root.dimorders
+        shards = [group._f_get_child('shard{}'.format(i)) for i in range(4)]
+
+        return ShardedDimension(shards,
+                                lookupatts=['order', 'line'],
+                                type1atts=[],
+                                type2atts=['status', 'currency'],
+                                asof='2015-10-23',
+                                **kwargs)
+
+    def test_rows_are_spread_and_merged(self):
+        import_orders(self.filename, 'tests/data/add 1 row.csv')
+
+        dim = self.open_dimension()
+        for row in self.h5file.root.orders.table.iterrows():
+            dim.update(row)
+        dim.flush()
+
+        rows = dim.read()
+
+        self.assertEqual(len(dim), 2)
+        self.assertEqual(dim.new_rows, 2)
+        self.assertEqual(sorted(rows['scd_id']), [1, 2])
+        self.assertEqual(sorted(rows['line']), [10, 20])
+
+        for row in self.h5file.root.orders.table.iterrows():
+            shard = dim.shards[dim.shard_of(row)]
+            self.assertEqual(len(shard.lookup(row)), 1)
+
+    def test_type2_update_in_shard(self):
+        import_orders(self.filename, 'tests/data/add 1 row.csv')
+
+        dim = self.open_dimension()
+        for row in self.h5file.root.orders.table.iterrows():
+            dim.update(row)
+        dim.flush()
+        self.h5file.close()
+
+        import_orders(self.filename, 'tests/data/modify 1 row.csv')
+
+        dim = self.open_dimension()
+        for row in self.h5file.root.orders.table.iterrows():
+            dim.update(row)
+        dim.flush()
+
+        self.assertEqual(dim.new_rows, 0)
+        self.assertEqual(dim.updated_type2_rows, 1)
+        # The second load reserves a new block of keys
+        self.assertEqual(sorted(dim.read()['scd_id']), [1, 2, 1001])
+
+    def test_migrated_hashes_keep_members_in_their_shard(self):
+        import_orders(self.filename, 'tests/data/add 1 row.csv')
+
+        dim = self.open_dimension()
+        for row in self.h5file.root.orders.table.iterrows():
+            dim.update(row)
+        dim.flush()
+
+        shards = [dim.shard_of(row)
+                  for row in self.h5file.root.orders.table.iterrows()]
+
+        for shard in dim.shards:
+            migrate_hashes(shard.connection, shard.attributes)
+        self.h5file.close()
+
+        dim = self.open_dimension(binaryhash=True, typedhash=True)
+        for row in self.h5file.root.orders.table.iterrows():
+            dim.update(row)
+        dim.flush()
+
+        self.assertEqual([dim.shard_of(row)
+                          for row in self.h5file.root.orders.table.iterrows()],
+                         shards)
+        self.assertEqual(dim.new_rows, 0)
+        self.assertEqual(len(dim), 2)
+
+    def test_dry_run_is_previewed_and_applied_per_shard(self):
+        import_orders(self.filename, 'tests/data/add 1 row.csv')
+
+        dim = self.open_dimension(dryrun=True)
+        for row in self.h5file.root.orders.table.iterrows():
+            dim.update(row)
+
+        changes = dim.to_dataframes()
+        shards = [dim.shard_of(row)
+                  for row in self.h5file.root.orders.table.iterrows()]
+
+        self.assertEqual(len(dim), 0)
+        self.assertEqual(sorted(changes['new']['shard']), sorted(shards))
+        self.assertEqual(sorted(changes['new']['line']), [10, 20])
+        self.assertRaises(ValueError, dim.compact)
+
+        dim.apply()
+
+        self.assertEqual(len(dim), 2)
+        self.assertEqual(sorted(dim.read()['line']), [10, 20])
+        self.assertEqual(len(dim.to_dataframes()['new']), 0)